@@ -1,19 +1,16 @@
 import os
 import sqlite3
 import datetime
-import threading
 import json
 import io
-from flask import Flask, request, jsonify, send_from_directory, Response, send_file
+from flask import Flask, Request, request, jsonify, send_from_directory, Response, send_file
 from flask_cors import CORS
-from utils.ocr import extract_text
-from utils.classification import classify_document, suggest_metadata_from_all, get_risk_level
 from database.db import (
     get_db_connection, init_db, save_document, create_container, get_all_containers, 
     log_transfer, get_container_logs, update_batch_qc, log_audit, update_document_metadata, 
-    get_filtered_documents, get_analytics_stats, get_document, publish_document, 
-    check_approval_required, update_approval_status, get_document_versions,
-    toggle_favorite, save_search_query, get_saved_searches, publish_saved_search
+    get_filtered_documents, get_document, publish_document, get_document_versions,
+    toggle_favorite, save_search_query, get_saved_searches, publish_saved_search,
+    start_checkpoint_scheduler
 )
 from PIL import Image, ImageDraw, ImageFont
 from reportlab.pdfgen import canvas
@@ -22,6 +19,10 @@ from reportlab.lib import colors
 import random
 import uuid
 from utils.cloud_manager import CloudManager
+from utils.worker_pool import WorkerPool
+from utils.upload_stream import HashingUploadFile, spool_upload
+from utils.processing import get_processing_queue, run_processing_job
+import functools
 import pytesseract
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
@@ -33,20 +34,39 @@ except ImportError:
     HAS_SCANNER_LIB = False
 
 
-app = Flask(__name__)
-# Force reload trigger - Fix Analytics
-CORS(app, resources={r"/*": {"origins": "*"}})
-
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
 PROCESSED_FOLDER = os.path.join(os.getcwd(), 'processed_docs')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PROCESSED_FOLDER, exist_ok=True)
 
+class IntakeRequest(Request):
+    """
+    Streams multipart file parts straight into UPLOAD_FOLDER while hashing them,
+    instead of werkzeug's default memory/temp spool followed by a second full read.
+    """
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingUploadFile(UPLOAD_FOLDER)
+
+app = Flask(__name__)
+app.request_class = IntakeRequest
+# Force reload trigger - Fix Analytics
+CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=['X-Next-Cursor'])
+
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
 
+# Processing Pool: workers = max concurrent jobs per queue (one Tesseract process each),
+# capacity = max unfinished jobs per queue before /upload answers 429.
+app.config['OCR_WORKERS'] = int(os.environ.get('KBN_OCR_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+app.config['OCR_QUEUE_CAPACITY'] = int(os.environ.get('KBN_OCR_QUEUE_CAPACITY', 500))
+app.config['TEXT_WORKERS'] = int(os.environ.get('KBN_TEXT_WORKERS', 2))
+app.config['TEXT_QUEUE_CAPACITY'] = int(os.environ.get('KBN_TEXT_QUEUE_CAPACITY', 1000))
+app.config['INPROCESS_WORKERS'] = os.environ.get('KBN_INPROCESS_WORKERS', '1') != '0'
+
 # Initialize Database
-init_db()
+# Render workers (spawn) import this module as __mp_main__; only the server sets up the database
+if __name__ != '__mp_main__':
+    init_db()
 
 # --- AUTH MIDDLEWARE ---
 from functools import wraps
@@ -87,7 +107,6 @@ def handle_exception(e):
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    import hashlib
     from database.db import check_duplicate_hash, log_audit, save_document, get_db_connection
     from utils.classification import suggest_metadata_from_all
 
@@ -95,15 +114,17 @@ def upload_file():
         return jsonify({"error": "No file part"}), 400
     
     file = request.files['file']
+    if file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
     
-    # Calculate Hash
-    file_content = file.read()
-    file_hash = hashlib.sha256(file_content).hexdigest()
-    file.seek(0) # Reset cursor
+    # Hash was computed while the body streamed to a temp file (no full read into memory)
+    spooled = spool_upload(file, app.config['UPLOAD_FOLDER'])
+    file_hash = spooled.hexdigest()
     
-    # Check Duplicate
+    # Check Duplicate before anything is committed to UPLOAD_FOLDER
     existing_doc = check_duplicate_hash(file_hash)
     if existing_doc:
+        spooled.close() # Discards the temp file
         return jsonify({
             "error": "Duplicate detected: This file already exists in the repository.",
             "existing_doc": {
@@ -175,29 +196,62 @@ def upload_file():
     if department:
         metadata['department'] = department
         
-    if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
-    
     if file:
         # Fix: Use unique filename to prevent collisions and wrong file serving
         unique_name = f"{uuid.uuid4().hex[:8]}_{file.filename}"
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_name)
-        file.save(filepath)
+        spooled.commit(filepath) # Rename of the temp file, no copy
         
+        page_count = 0
         if file.filename.lower().endswith('.pdf'):
-            from utils.splitting import split_pdf
-            split_files = split_pdf(filepath, app.config['UPLOAD_FOLDER'])
-            if not split_files: # Fallback if splitting fails or returns empty
-                split_files = [filepath]
-        else:
-            split_files = [filepath]
-
+            from utils.splitting import count_pages_by_queue, iter_pdf_pages
+            queue_counts = count_pages_by_queue(filepath)
+            page_count = sum(queue_counts.values())
+
+        # Backpressure: reserve pool slots for every page before creating any records
+        if not page_count:
+            queue_counts = {get_processing_queue(filepath): 1}
+
+        reserved = []
+        for q_name, count in queue_counts.items():
+            if not processing_pool.reserve(q_name, count):
+                for r_name, r_count in reserved:
+                    processing_pool.release(r_name, r_count)
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                response = jsonify({
+                    "error": "Processing queue is full. Please retry shortly.",
+                    "queue": q_name
+                })
+                response.headers['Retry-After'] = '30'
+                return response, 429
+            reserved.append((q_name, count))
         
+        split_failure = {}
+
+        def split_files():
+            # Pages are yielded as they finish rendering, so page 1 is queued for OCR
+            # while later pages are still being rasterized
+            rendered = 0
+            if page_count:
+                try:
+                    for page_path in iter_pdf_pages(filepath, app.config['UPLOAD_FOLDER']):
+                        rendered += 1
+                        yield page_path
+                except Exception as e:
+                    app.logger.error(f"Splitting {unique_name} stopped after {rendered} of {page_count} pages: {e}")
+                    if rendered:
+                        split_failure.update(rendered=rendered, error=str(e))
+            if not rendered: # Fallback if splitting fails or returns empty
+                yield filepath
+
         results = []
+        first_file = None
         
         try:
-            # Create initial DB records and start background threads
-            for split_path in split_files:
+            # Create initial DB records and queue a processing job per page
+            for split_path in split_files():
+                first_file = first_file or split_path
                 filename = os.path.basename(split_path)
                 
                 # Check for filename-based hints if category matches 'Auto-Detect' (None)
@@ -213,7 +267,7 @@ def upload_file():
                     content="OCR Pending...",
                     container_id=container_id,
                     batch_id=batch_id,
-                    ocr_status="Processing",
+                    ocr_status="Queued",
                     uploader_id=uploader_id,
                     tags=tags,
                     metadata=meta_json,
@@ -242,16 +296,42 @@ def upload_file():
                 results.append({
                     "id": doc_id,
                     "filename": filename,
-                    "status": "Processing"
+                    "status": "Queued"
                 })
                 
-                # Start background thread
-                thread = threading.Thread(target=process_document_background, args=(doc_id, split_path))
-                thread.daemon = True # Daemon thread so it doesn't block app exit
-                thread.start()
+                # Durable job: survives restarts, picked up by any worker on this queue.
+                # Uses a slot reserved above; the whole-PDF fallback may land on
+                # a queue nothing was reserved on
+                q_name = get_processing_queue(split_path)
+                has_slot = queue_counts.get(q_name, 0) > 0
+                processing_pool.submit(q_name, doc_id, split_path, reserved=has_slot)
+                if has_slot:
+                    queue_counts[q_name] -= 1
             
+            if split_failure:
+                # Later pages could not be split: keep them visible as a failed
+                # document on the original PDF instead of dropping them
+                first_missing = split_failure['rendered'] + 1
+                doc_id = save_document(
+                    filename=unique_name,
+                    category=category or "Unclassified",
+                    confidence=0.0,
+                    content=f"Pages {first_missing}-{page_count} could not be split: {split_failure['error']}",
+                    container_id=container_id,
+                    batch_id=batch_id,
+                    ocr_status="Failed",
+                    uploader_id=uploader_id,
+                    tags=tags,
+                    metadata=json.dumps(metadata) if metadata else None,
+                    content_hash=file_hash,
+                    parent_doc_id=parent_doc_id,
+                    version_number=version_number,
+                    expiry_date=expiry_date
+                )
+                results.append({"id": doc_id, "filename": unique_name, "status": "Failed"})
+
             # Get suggestions from filename for the first document as a hint
-            initial_suggestions = suggest_metadata_from_all(os.path.basename(split_files[0])) if split_files else {}
+            initial_suggestions = suggest_metadata_from_all(os.path.basename(first_file)) if first_file else {}
 
             from database.db import log_audit
             log_audit('batch' if batch_id else 'document_group', batch_id or 0, 'UPLOAD', f"Uploaded {len(results)} documents", uploader_id, ip_address=request.remote_addr)
@@ -266,6 +346,12 @@ def upload_file():
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
+        finally:
+            # Give back slots for pages that never made it into the pool
+            for q_name, count in queue_counts.items():
+                if count > 0:
+                    processing_pool.release(q_name, count)
+
 # --- SECURITY ENDPOINTS ---
 @app.route('/users', methods=['GET'])
 def get_users_route():
@@ -340,12 +426,9 @@ def approve_access_route():
     
     # Check if reviewer is Owner or Admin
     # (assuming is_admin check is handled by frontend passing a flag or we check user role from DB)
-    # For robust security, we should check the user role from DB for 'reviewer'
-    conn = get_db_connection()
-    user_row = conn.execute("SELECT role FROM users WHERE id = ?", (reviewer,)).fetchone()
-    conn.close()
-    
-    is_admin = user_row and user_row['role'] == 'Admin'
+    # For robust security, we check the user role from DB for 'reviewer'
+    from database.permissions import get_permission_context
+    is_admin = get_permission_context(reviewer).is_admin
     owner_id = doc.get('owner_id')
     
     # Fallback: if no owner, allow Admin or Uploader (legacy)
@@ -364,7 +447,7 @@ def approve_access_route():
 
 @app.route('/view/<int:doc_id>', methods=['GET'])
 def view_document_route(doc_id):
-    from database.db import get_document, log_audit, get_db_connection
+    from database.db import get_document, log_audit, has_access_grant
     doc = get_document(doc_id)
     if not doc:
         return jsonify({"error": "Document not found"}), 404
@@ -383,11 +466,7 @@ def view_document_route(doc_id):
         
         # Check Access Request if not allowed yet
         if not allowed:
-             conn = get_db_connection()
-             req = conn.execute("SELECT status FROM access_requests WHERE user_id = ? AND document_id = ? AND status = 'Approved'", (user_id, doc_id)).fetchone()
-             if req:
-                 allowed = True
-             conn.close()
+             allowed = has_access_grant(user_id, doc_id)
              
         if not allowed:
             return "Access Denied. Restricted Document.", 403
@@ -441,221 +520,46 @@ def view_document_route(doc_id):
             
     return send_file(file_path)
 
-def process_document_background(doc_id, filepath):
-    """
-    Background worker to run OCR and Classification, then update DB.
-    """
-    try:
-        # Fetch existing doc to check for overrides (manual category/metadata)
-        from database.db import get_document
-        existing_doc = get_document(doc_id)
-        manual_category = None
-        manual_metadata = {}
-        if existing_doc:
-            if existing_doc['category'] and existing_doc['category'] != 'Unclassified':
-                manual_category = existing_doc['category']
-            if existing_doc['metadata']:
-                try:
-                    manual_metadata = json.loads(existing_doc['metadata'])
-                except:
-                    pass
-
-        # 1. OCR
-        text, confidence, confidence_reason = extract_text(filepath)
-        # 1. OCR
-        text, confidence, confidence_reason = extract_text(filepath)
-        
-        # Validation & Fallback
-        if not text or len(text.strip()) < 10 or text == "OCR_SKIPPED":
-             # Fallback: Try to classify by filename
-            # from utils.classification import suggest_metadata_from_all # REMOVED: Use global
-            suggestions = suggest_metadata_from_all(os.path.basename(filepath))
-            
-            fallback_category = suggestions.get('category')
-            
-            # IMPROVEMENT: If manual category exists, we don't fail, we just succeed with no OCR content
-            if manual_category:
-                # Success via Manual Override
-                category = manual_category
-                # Metadata
-                meta_json = json.dumps(manual_metadata) if manual_metadata else "{}"
-                
-                update_document_status(doc_id, "Completed (No OCR)", "Content parsing skipped (OCR missing).", 1.0, category, meta_json, category + " Template")
-                return
-
-            if fallback_category:
-                # Success via Fallback
-                category = fallback_category
-                
-                # We save with a specific status indicating no OCR was done
-                ocr_status_label = "Completed (No OCR)"
-                
-                # Construct metadata from suggestions
-                meta_json = json.dumps(suggestions)
-                
-                update_document_status(doc_id, ocr_status_label, "Content parsing skipped (OCR missing).", 0.5, category, meta_json, category + " Template")
-                log_audit('document', doc_id, 'classification_fallback', f"Classified as {category} using filename fallback", "System")
-                return
-            else:
-                # Failed and no fallback found
-                target_cat = "Unclassified"
-                update_document_status(doc_id, "Failed", "No text detected and filename insufficient.", 0.0, target_cat)
-                return
-
-        # 2. Classification
-        classified_cat, classified_conf = classify_document(text)
-        
-        # IMPROVEMENT: Priority Logic
-        if manual_category:
-            category = manual_category
-            final_confidence = 1.0 # High confidence because user said so
-        else:
-            category = classified_cat
-            # Map "High"/"Medium"/"Low" to float?
-            # heuristic: High=0.9, Medium=0.7, Low=0.4? 
-            # Or just use the OCR confidence? 
-            # Existing code used 'confidence' (from OCR)
-            # Let's use OCR confidence but boosted if Classification matches something?
-            # For now, stick to OCR confidence unless it's very low?
-            final_confidence = confidence
-
-        # 3. Extraction
-        from utils.extraction import extract_metadata
-        extracted_metadata = extract_metadata(text, category)
-        
-        # Merge Metadata (Manual overrides extracted)
-        # Ensure extracted_metadata is dict
-        if isinstance(extracted_metadata, str):
-            try:
-                extracted_metadata = json.loads(extracted_metadata)
-            except:
-                extracted_metadata = {}
-        
-        if not isinstance(extracted_metadata, dict):
-            extracted_metadata = {}
-            
-        # Merge: Start with extracted, update with manual
-        final_metadata = extracted_metadata.copy()
-        final_metadata.update(manual_metadata)
-        metadata_json = json.dumps(final_metadata)
-
-        # 4. Auto-Renaming & Routing (Moved After Extraction)
-        from utils.renaming import process_rename_and_move
-        # Pass final_metadata for intelligent naming
-        new_path = process_rename_and_move(doc_id, filepath, category, app.config['UPLOAD_FOLDER'], final_metadata)
-        if new_path:
-            filepath = new_path
-            print(f"Auto-Renamed and Moved to: {filepath}")
-
-        # 5. Suggestions (Refined)
-        final_suggestions = suggest_metadata_from_all(os.path.basename(filepath), text)
-        
-        # 6. Update DB with success
-        update_document_status(doc_id, "Completed", text, final_confidence, category, metadata_json, category + " Template", confidence_reason)
-        
-        # 7. Legacy Auto-Routing Logic (FR-24) - Keeps container routing
-        routing_keywords = {
-            'HR': 'DEPT-HR',
-            'HUMAN RESOURCES': 'DEPT-HR',
-            'FINANCE': 'DEPT-FINANCE',
-            'PAYROLL': 'DEPT-FINANCE',
-            'LEGAL': 'DEPT-LEGAL',
-            'CONTRACT': 'DEPT-LEGAL',
-            'OPERATIONS': 'DEPT-OPERATIONS',
-            'SALES': 'DEPT-SALES',
-            'UAE': 'DEPT-UAE',
-            'DUBAI': 'DEPT-UAE',
-            'KBN UAE': 'DEPT-UAE'
-        }
-        
-        found_container = None
-        upper_text = text.upper()
-        for kw, cid in routing_keywords.items():
-            if kw in upper_text:
-                found_container = cid
-                break
-        
-        if found_container:
-            # Check if container exists before routing
-            conn = get_db_connection()
-            exists = conn.execute("SELECT 1 FROM containers WHERE id = ?", (found_container,)).fetchone()
-            if exists:
-                conn.execute("UPDATE documents SET container_id = ? WHERE id = ?", (found_container, doc_id))
-                conn.commit()
-                log_audit('document', doc_id, 'auto_route', f"Automatically routed to {found_container} base on keywords", "System")
-            conn.close()
-
-        # 7. Confidence-Based Automation and Approval Logic
-        risk = get_risk_level(category)
-        
-        # Determine initial approval status
-        from database.db import get_db_connection
-        conn = get_db_connection()
-        container_row = conn.execute('SELECT confidentiality_level FROM containers WHERE id = (SELECT container_id FROM documents WHERE id = ?)', (doc_id,)).fetchone()
-        confidentiality = container_row['confidentiality_level'] if container_row else 'Internal'
-        conn.close()
-        
-        needs_approval = check_approval_required(category, confidentiality)
-        
-        if needs_approval:
-            update_document_status(doc_id, "Completed", text, final_confidence, category, metadata_json, category + " Template")
-            update_approval_status(doc_id, "Pending Approval", "System")
-        
-        # FR-32: Fast-Track QC Logic
-        elif final_confidence > 90 and risk == "Low":
-            # High confidence + Low Risk -> QC Passed automatically
-            # We still mark as 'Completed' but maybe we can introduce 'QC_Passed'
-            # Let's say 'QC_Passed' is a status or we just skip QC queue.
-            # If we don't set to 'QC_Passed', it might fall into QC Queue if it's default pending?
-            # Let's see: batches are pending by default. 
-            # If we want to skip legacy QC for these, update `ocr_status` to 'QC_Passed' or 'Published'?
-            # The prompt says "set status to 'QC_Passed'".
-            
-            update_document_status(doc_id, "QC_Passed", text, final_confidence, category, metadata_json, category + " Template", confidence_reason)
-            log_audit('document', doc_id, 'auto-qc', f"Auto-passed QC (Conf: {final_confidence}%)", "System")
-            
-            # Auto-publish if really confident? Request says "QC_Passed". 
-            # If 'QC_Passed' means ready for export, that's good.
-        else:
-            # Rigorous QC Required
-            # Mark as 'Rigorous_QC' or just standard 'Completed' (which means Pending QC in new flow?)
-            # Let's mark as 'Rigorous_QC' to be explicit in the UI badges.
-            update_document_status(doc_id, "Rigorous_QC", text, final_confidence, category, metadata_json, category + " Template", confidence_reason)
-        
-    except Exception as e:
-        print(f"Background Job Failed for Doc {doc_id}: {e}")
-        # update_document_status will need to handle strict args, maybe pass Nones
-        update_document_status(doc_id, "Failed", f"Error: {str(e)}", 0.0, "Unclassified", "{}", None)
+# --- Processing Pool ---
+processing_pool = WorkerPool(functools.partial(run_processing_job, upload_folder=app.config['UPLOAD_FOLDER']))
+processing_pool.add_queue('ocr', app.config['OCR_WORKERS'], app.config['OCR_QUEUE_CAPACITY'])
+processing_pool.add_queue('text', app.config['TEXT_WORKERS'], app.config['TEXT_QUEUE_CAPACITY'])
+
+@app.before_request
+def start_processing_pool():
+    # Started on the first request (not at import) so the debug reloader's parent
+    # process never consumes jobs. Set KBN_INPROCESS_WORKERS=0 when all processing
+    # is done by dedicated scripts/ocr_worker.py processes.
+    if app.config['INPROCESS_WORKERS']:
+        processing_pool.start()
+    start_checkpoint_scheduler()
+
+@app.teardown_appcontext
+def close_db_connection(exc):
+    # Every helper used during the request shared this thread's connection
+    from database.db import release_db_connection
+    release_db_connection(close=True)
+
+@app.route('/processing/status', methods=['GET'])
+def processing_status():
+    from database.db import get_job_stats
+    return jsonify({
+        "workers": processing_pool.stats() if app.config['INPROCESS_WORKERS'] else {},
+        "jobs": get_job_stats()
+    })
 
-def update_document_status(doc_id, status, content, confidence, category, metadata=None, template_type=None, confidence_reason=None):
-    from database.db import validate_metadata, log_audit
-    
-    # FR-15: Validation
-    if metadata:
-        import json
-        try:
-            m_dict = json.loads(metadata) if isinstance(metadata, str) else metadata
-            is_valid, error = validate_metadata(category, m_dict)
-            if not is_valid:
-                log_audit('Document', doc_id, 'Validation Error', error, 'System')
-                # For now, we still save but mark status or log error. 
-                # Request says "implement field-level validation", usually implying logging or blocking.
-        except:
-            pass
+@app.route('/processing/dead-letter', methods=['GET'])
+def dead_letter_jobs():
+    from database.db import get_dead_jobs
+    return jsonify(get_dead_jobs())
 
-    from database.db import get_db_connection
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE documents 
-            SET ocr_status = ?, content = ?, confidence = ?, category = ?, metadata = ?, template_type = ?, confidence_reason = ?
-            WHERE id = ?
-        ''', (status, content, confidence, category, metadata, template_type, confidence_reason, doc_id))
-        conn.commit()
-        conn.close()
-    except Exception as e:
-        print(f"Failed to update DB for doc {doc_id}: {e}")
+@app.route('/processing/jobs/<int:job_id>/retry', methods=['POST'])
+def retry_job_route(job_id):
+    from database.db import retry_dead_job
+    if retry_dead_job(job_id):
+        processing_pool.wakeup.set()
+        return jsonify({"message": "Job re-queued"}), 200
+    return jsonify({"error": "Job not found or not dead-lettered"}), 404
 
 @app.route('/containers', methods=['GET', 'POST'])
 def manage_containers():
@@ -777,7 +681,7 @@ def rescan_document_route(doc_id):
     reason = data.get('reason', 'Rescan Requested')
     user = data.get('user', 'System')
     
-    from database.db import update_document_status, log_audit, save_document_version
+    from database.db import log_audit, save_document_version
     
     # Save current version before resetting
     save_document_version(doc_id, f"Rescan Requested: {reason}", user)
@@ -873,6 +777,34 @@ def update_doc_sla_route(doc_id):
 
 
 
+# --- Pagination ---
+# Listing endpoints return every row unless the client asks for pages with
+# ?limit=N; the cursor for the next page comes back in the X-Next-Cursor header
+# and is passed as ?cursor=... (keyset pagination, stable under inserts).
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+def get_page_args(search=None):
+    """Returns (limit, after) for get_filtered_documents; (None, None) when not paginating."""
+    from database.db import decode_page_cursor
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    if not limit and not cursor:
+        return None, None
+    limit = min(max(1, limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    after = decode_page_cursor(cursor, search) if cursor else None
+    return limit, after
+
+def page_response(documents, limit, search=None):
+    """documents were fetched with limit + 1 rows; the extra row only signals another page."""
+    from database.db import encode_page_cursor
+    if not limit:
+        return jsonify(documents)
+    response = jsonify(documents[:limit])
+    if len(documents) > limit:
+        response.headers['X-Next-Cursor'] = encode_page_cursor(documents[limit - 1], search)
+    return response
+
 @app.route('/documents', methods=['GET'])
 @app.route('/api/documents', methods=['GET'])
 def list_documents():
@@ -891,8 +823,13 @@ def list_documents():
     department = request.args.get('department')
     function = request.args.get('function')
     tags = request.args.get('tags')
+    from database.db import get_filtered_documents, parse_document_fields
+    try:
+        limit, after = get_page_args(search_query)
+        fields = parse_document_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
-    from database.db import get_filtered_documents
     documents = get_filtered_documents(
         category=category, 
         start_date=start_date, 
@@ -906,13 +843,16 @@ def list_documents():
         subsidiary=subsidiary,
         department=department,
         function=function,
-        tags=tags
+        tags=tags,
+        limit=limit + 1 if limit else None,
+        after=after,
+        fields=fields
     )
-    return jsonify(documents)
+    return page_response(documents, limit, search_query)
 
 @app.route('/document/<int:doc_id>', methods=['GET'])
 def get_document_details(doc_id):
-    doc = get_document(doc_id)
+    doc = get_document(doc_id, with_text=True)
     if doc:
         return jsonify(doc)
     return jsonify({"error": "Document not found"}), 404
@@ -950,8 +890,8 @@ def export_csv():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    from database.db import get_filtered_documents
-    documents = get_filtered_documents(category, start_date, end_date)
+    from database.db import get_filtered_documents, DOCUMENT_SUMMARY_FIELDS
+    documents = get_filtered_documents(category, start_date, end_date, fields=DOCUMENT_SUMMARY_FIELDS + ('metadata',))
     
     import csv
     import io
@@ -999,9 +939,15 @@ def search():
     category = request.args.get('category')
     subsidiary = request.args.get('subsidiary')
     department = request.args.get('department')
+    from database.db import get_filtered_documents, log_audit, parse_document_fields
+    try:
+        limit, after = get_page_args(query)
+        fields = parse_document_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     # Use the enhanced filtering logic
-    from database.db import get_filtered_documents, log_audit
+    # Extra Visibility Guard: Filter out Pending Approval unless Admin (in SQL so pages stay full)
     results = get_filtered_documents(
         search=query, 
         user_id=user_id, 
@@ -1009,15 +955,15 @@ def search():
         only_published=True,
         category=category,
         subsidiary=subsidiary,
-        department=department
+        department=department,
+        hide_pending_approval=not is_admin,
+        limit=limit + 1 if limit else None,
+        after=after,
+        fields=fields
     )
-    
-    # Extra Visibility Guard: Filter out Pending Approval and Confidential unless Admin
-    if not is_admin:
-        results = [d for d in results if d.get('approval_status') != 'Pending Approval']
         
     # Log 0 results with context (FR-26)
-    if len(results) == 0:
+    if len(results) == 0 and not after:
         log_audit(
             'search', 0, 'SEARCH_ZERO_RESULTS', 
             f"Query '{query}' returned 0 results. Filters: Cat={category}, Sub={subsidiary}", 
@@ -1026,7 +972,7 @@ def search():
             scope='Global Search'
         )
 
-    return jsonify(results)
+    return page_response(results, limit, query)
 
 @app.route('/documents/<int:doc_id>/reclassify', methods=['POST'])
 def reclassify_document_route(doc_id):
@@ -1043,7 +989,7 @@ def reclassify_document_route(doc_id):
     from database.db import get_document, update_document_metadata, log_audit
     from utils.extraction import extract_metadata
     
-    doc = get_document(doc_id)
+    doc = get_document(doc_id, with_text=True)
     if not doc:
         return jsonify({"error": "Doc not found"}), 404
     
@@ -1092,6 +1038,7 @@ def get_restricted_report_route():
 @require_auth(roles=['Admin'])
 def manage_access_policies():
     from database.db import get_db_connection, log_audit
+    from database.permissions import invalidate_permission_cache
     
     conn = get_db_connection()
     
@@ -1115,6 +1062,7 @@ def manage_access_policies():
             else:
                 conn.execute("INSERT INTO access_policies (role, allowed_levels) VALUES (?, ?)", (role, levels))
             conn.commit()
+            invalidate_permission_cache()
             log_audit('access_policy', 0, 'UPDATE_POLICY', f"Updated access for {role} to {levels}", "Admin")
             return jsonify({"message": "Policy updated"}), 200
         except Exception as e:
@@ -1246,9 +1194,8 @@ def delete_document(doc_id):
                 os.remove(proc_path)
              except: pass
 
+        # The documents_ad trigger removes the search index row
         conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
-        # Also clean up FTS
-        conn.execute("DELETE FROM documents_fts WHERE id = ?", (doc_id,))
         conn.commit()
         log_audit('document', doc_id, 'DELETE_PERMANENT', "Document permanently deleted", user_id)
     else:
@@ -1325,12 +1272,13 @@ def manage_taxonomy():
         data = request.json
         category = data.get('category')
         value = data.get('value')
+        keywords = data.get('keywords')
         user = 'Admin_User' # Mock
         
         if not category or not value:
             return jsonify({"error": "Missing fields"}), 400
             
-        success = add_taxonomy_item(category, value)
+        success = add_taxonomy_item(category, value, keywords)
         if success:
             log_audit('taxonomy', 0, 'ADD_TERM', f"Added {value} to {category}", user, new_value=value, scope='Governance', ip_address=request.remote_addr)
             return jsonify({"message": "Taxonomy item added"}), 201
@@ -1339,13 +1287,6 @@ def manage_taxonomy():
     category = request.args.get('category')
     return jsonify(get_taxonomy(category))
 
-@app.route('/analytics', methods=['GET'])
-def get_analytics_route():
-    import importlib
-    import database.db as db_module
-    importlib.reload(db_module)
-    return jsonify(db_module.get_analytics_stats())
-
 @app.route('/taxonomy/filters', methods=['GET'])
 def get_filter_options():
     """
@@ -1370,13 +1311,20 @@ def get_filter_options():
 
 @app.route('/taxonomy/<int:item_id>', methods=['PATCH'])
 def update_taxonomy(item_id):
-    from database.db import update_taxonomy_status
+    from database.db import update_taxonomy_status, update_taxonomy_keywords
     # Admin check
     is_admin = request.args.get('is_admin', 'false').lower() == 'true'
     if not is_admin:
         return jsonify({"error": "Admin access required"}), 403
         
-    status = request.json.get('status')
+    data = request.json
+    if 'keywords' in data:
+        # Classifier keywords, e.g. "purchase order:3, po number:2, delivery"
+        update_taxonomy_keywords(item_id, data.get('keywords') or None)
+        if 'status' not in data:
+            return jsonify({"message": "Keywords updated"})
+
+    status = data.get('status')
     if status not in ['Active', 'Deprecated']:
         return jsonify({"error": "Invalid status"}), 400
         
@@ -1385,9 +1333,8 @@ def update_taxonomy(item_id):
 
 @app.route('/analytics', methods=['GET'])
 def get_analytics():
-    from database.db import get_analytics_stats
-    stats = get_analytics_stats()
-    return jsonify(stats)
+    from utils.analytics import get_analytics_stats
+    return jsonify(get_analytics_stats())
 
 # --- Watermarking Helpers ---
 
@@ -1453,8 +1400,15 @@ def manage_favorites():
         return jsonify({"is_favorite": status}), 200
     
     # GET favorites
-    docs = get_filtered_documents(user_id=user_id, is_admin=True, favorite_only=True)
-    return jsonify(docs)
+    from database.db import parse_document_fields
+    try:
+        limit, after = get_page_args()
+        fields = parse_document_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    docs = get_filtered_documents(user_id=user_id, is_admin=True, favorite_only=True,
+                                  limit=limit + 1 if limit else None, after=after, fields=fields)
+    return page_response(docs, limit)
 
 @app.route('/saved-searches', methods=['GET', 'POST'])
 def manage_saved_searches():
@@ -1595,10 +1549,23 @@ def get_versions_route(doc_id):
     versions = get_document_versions(doc_id)
     return jsonify(versions)
 
+@app.route('/documents/<int:doc_id>/versions/history', methods=['GET'])
+def get_version_history_route(doc_id):
+    from database.db import get_document_version_history
+    return jsonify(get_document_version_history(doc_id))
+
+@app.route('/documents/<int:doc_id>/versions/<int:version_id>', methods=['GET'])
+def get_version_route(doc_id, version_id):
+    from database.db import get_document_version
+    version = get_document_version(doc_id, version_id)
+    if not version:
+        return jsonify({"error": "Version not found"}), 404
+    return jsonify(version)
+
 @app.route('/documents/<int:doc_id>/details', methods=['GET'])
 def get_doc_details_route(doc_id):
     from database.db import get_document
-    doc = get_document(doc_id)
+    doc = get_document(doc_id, with_text=True)
     if doc:
         return jsonify(dict(doc))
     return jsonify({"error": "Not found"}), 404
@@ -2,17 +2,362 @@ import sqlite3
 import datetime
 import os
 import shutil
+import threading
+import time
+import base64
+import hashlib
+import json
+import zlib
 from werkzeug.security import generate_password_hash, check_password_hash
 
 DB_NAME = 'documents.db'
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+# Applied once when a thread's connection is opened. The database runs in WAL
+# mode (set by init_db), so readers never block the writer and vice versa;
+# synchronous=NORMAL is durable across application crashes in WAL mode and
+# only fsyncs at checkpoints.
+DB_BUSY_TIMEOUT_MS = int(os.environ.get('KBN_DB_BUSY_TIMEOUT_MS', 15000))
+DB_CACHE_KB = int(os.environ.get('KBN_DB_CACHE_KB', 32768))
+DB_MMAP_MB = int(os.environ.get('KBN_DB_MMAP_MB', 256))
+DB_CHECKPOINT_SECONDS = int(os.environ.get('KBN_DB_CHECKPOINT_SECONDS', 300))
+
+CONNECTION_PRAGMAS = [
+    ('busy_timeout', DB_BUSY_TIMEOUT_MS),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -DB_CACHE_KB),
+    ('mmap_size', DB_MMAP_MB * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+]
+
+class ThreadConnection(sqlite3.Connection):
+    """
+    Connection shared by all helpers running on one thread.
+
+    Helpers keep the usual get_db_connection() / close() pattern: close() only
+    hands the connection back, and once the outermost user has closed it any
+    uncommitted work is rolled back, just as closing a private connection
+    would have discarded it. The connection itself stays open (prepared
+    statements and parsed schema included) until release_db_connection(close=True).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.depth = 0
+
+    def close(self):
+        self.depth = max(0, self.depth - 1)
+        if self.depth == 0 and self.in_transaction:
+            self.rollback()
+
+    def close_for_real(self):
+        super().close()
+
+# OCR text lives in document_text, so documents rows stay small for the
+# listing and status-update paths. Bodies above this size are zlib-compressed.
+TEXT_COMPRESS_MIN_BYTES = int(os.environ.get('KBN_TEXT_COMPRESS_MIN_BYTES', 512))
+
+# A document's text, for queries over documents d (rows written inline by older versions fall back to d.content)
+DOCUMENT_TEXT_SQL = "COALESCE((SELECT decode_text(t.encoding, t.body) FROM document_text t WHERE t.document_id = d.id), d.content)"
+
+def encode_document_text(text):
+    """Returns (encoding, body, size_bytes) for a document_text row."""
+    data = text.encode('utf-8')
+    if len(data) >= TEXT_COMPRESS_MIN_BYTES:
+        return 'zlib', zlib.compress(data, 6), len(data)
+    return 'plain', data, len(data)
+
+def decode_document_text(encoding, body):
+    if body is None:
+        return None
+    if encoding == 'zlib':
+        body = zlib.decompress(body)
+    return body.decode('utf-8') if isinstance(body, bytes) else body
+
+_local = threading.local()
+
+def _open_connection(path):
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT_MS / 1000.0, factory=ThreadConnection, cached_statements=256)
     conn.row_factory = sqlite3.Row # This allows us to access columns by name
+    # document_text bodies are decoded in SQL (search index triggers, listings)
+    conn.create_function('decode_text', 2, decode_document_text, deterministic=True)
+    for name, value in CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
     return conn
 
+def get_db_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None or _local.path != DB_NAME:
+        if conn is not None:
+            conn.close_for_real()
+        conn = _open_connection(DB_NAME)
+        _local.conn = conn
+        _local.path = DB_NAME
+    conn.depth += 1
+    return conn
+
+def release_db_connection(close=False):
+    """
+    End of a unit of work on this thread (a request, a processing job): rolls
+    back anything left uncommitted and resets the connection. Request threads
+    close it; long-lived workers keep it for the next job.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        return
+    conn.depth = 0
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+    finally:
+        if close:
+            conn.close_for_real()
+            _local.conn = None
+
+def checkpoint_wal(mode='PASSIVE'):
+    """Copies committed WAL frames back into the database file. Returns (busy, wal_pages, checkpointed_pages)."""
+    conn = get_db_connection()
+    try:
+        return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+    finally:
+        conn.close()
+
+_checkpointer = {'thread': None}
+
+def start_checkpoint_scheduler(interval=DB_CHECKPOINT_SECONDS):
+    """
+    Background thread that truncates the WAL periodically. SQLite's automatic
+    checkpoints are passive and never finish while readers keep the tail of the
+    WAL busy, so under steady load the file would only grow.
+
+    The same pass moves access approvals past their expiry date to Expired.
+    """
+    if _checkpointer['thread'] is not None or interval <= 0:
+        return
+    def loop():
+        stop = threading.Event()
+        while not stop.wait(interval):
+            try:
+                busy, wal_pages, done = checkpoint_wal('TRUNCATE')
+                if busy:
+                    # Writers were active throughout; a passive pass still shortens the next one
+                    checkpoint_wal('PASSIVE')
+            except sqlite3.Error as e:
+                print(f"WAL checkpoint failed: {e}")
+            try:
+                expire_access_grants()
+            except sqlite3.Error as e:
+                print(f"Access grant expiry failed: {e}")
+    t = threading.Thread(target=loop, name="db-checkpoint")
+    t.daemon = True
+    _checkpointer['thread'] = t
+    t.start()
+
+# FR-17: Global search index. The FTS rowid is the document id.
+SEARCH_TOKENIZERS = {
+    # Words, accents folded (Société matches societe); prefix indexes serve type-ahead
+    'unicode61': "unicode61 remove_diacritics 2",
+    # Any substring of 3+ characters, e.g. the tail of an invoice number
+    'trigram': "trigram",
+}
+SEARCH_TOKENIZER = os.environ.get('KBN_FTS_TOKENIZER', 'unicode61')
+SEARCH_PREFIX = os.environ.get('KBN_FTS_PREFIX', '2 3')
+# bm25 column weights: filename, content, category, tags
+SEARCH_WEIGHTS = os.environ.get('KBN_FTS_WEIGHTS', '10,1,4,4')
+SEARCH_REINDEX_BATCH = int(os.environ.get('KBN_FTS_REINDEX_BATCH', 2000))
+
+# Identifies the index layout; init_db reindexes when the stored one differs
+SEARCH_INDEX_VERSION = f"4:{SEARCH_TOKENIZER}:{SEARCH_PREFIX if SEARCH_TOKENIZER != 'trigram' else ''}"
+
+def _search_table_sql(table):
+    if SEARCH_TOKENIZER not in SEARCH_TOKENIZERS:
+        raise ValueError(f"Unknown KBN_FTS_TOKENIZER '{SEARCH_TOKENIZER}' (expected one of {', '.join(SEARCH_TOKENIZERS)})")
+    options = f"tokenize = '{SEARCH_TOKENIZERS[SEARCH_TOKENIZER]}'"
+    if SEARCH_TOKENIZER != 'trigram' and SEARCH_PREFIX:
+        options += f", prefix = '{SEARCH_PREFIX}'"
+    return f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(filename, content, category, tags, {options})"
+
+def _search_trigger_sql(table, suffix=''):
+    return [f'''
+        CREATE TRIGGER IF NOT EXISTS documents_ai{suffix} AFTER INSERT ON documents BEGIN
+            INSERT INTO {table}(rowid, filename, content, category, tags)
+            VALUES (new.id, new.filename, new.content, new.category, new.tags);
+        END
+    ''', f'''
+        CREATE TRIGGER IF NOT EXISTS documents_ad{suffix} AFTER DELETE ON documents BEGIN
+            DELETE FROM {table} WHERE rowid = old.id;
+        END
+    ''', f'''
+        -- Status, routing and assignment updates leave the index alone: only
+        -- re-tokenize when an indexed column actually changed
+        CREATE TRIGGER IF NOT EXISTS documents_au{suffix} AFTER UPDATE OF filename, category, tags ON documents
+        WHEN old.filename IS NOT new.filename OR old.category IS NOT new.category OR old.tags IS NOT new.tags
+        BEGIN
+            UPDATE {table}
+            SET filename = new.filename, category = new.category, tags = new.tags
+            WHERE rowid = new.id;
+        END
+    ''', f'''
+        -- Inline content from tools that predate document_text
+        CREATE TRIGGER IF NOT EXISTS documents_au_content{suffix} AFTER UPDATE OF content ON documents
+        WHEN new.content IS NOT NULL AND new.content IS NOT old.content
+        BEGIN
+            UPDATE {table} SET content = new.content WHERE rowid = new.id;
+        END
+    ''', f'''
+        CREATE TRIGGER IF NOT EXISTS document_text_ai{suffix} AFTER INSERT ON document_text BEGIN
+            UPDATE {table} SET content = decode_text(new.encoding, new.body) WHERE rowid = new.document_id;
+        END
+    ''', f'''
+        CREATE TRIGGER IF NOT EXISTS document_text_au{suffix} AFTER UPDATE ON document_text BEGIN
+            UPDATE {table} SET content = decode_text(new.encoding, new.body) WHERE rowid = new.document_id;
+        END
+    ''', f'''
+        CREATE TRIGGER IF NOT EXISTS document_text_ad{suffix} AFTER DELETE ON document_text BEGIN
+            UPDATE {table} SET content = NULL WHERE rowid = old.document_id;
+        END
+    ''']
+
+def _drop_search_triggers(conn, suffix=''):
+    for name in ('documents_ai', 'documents_ad', 'documents_au', 'documents_au_content',
+                 'document_text_ai', 'document_text_au', 'document_text_ad'):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}{suffix}")
+
+def _apply_search_weights(conn, table='documents_fts'):
+    # Stored in the index config, so `rank` (and ORDER BY rank) uses the weights
+    weights = ', '.join(str(float(w)) for w in SEARCH_WEIGHTS.split(','))
+    rank = f"bm25({weights})"
+    current = conn.execute(f"SELECT v FROM {table}_config WHERE k = 'rank'").fetchone()
+    if not current or current[0] != rank:
+        conn.execute(f"INSERT INTO {table}({table}, rank) VALUES ('rank', ?)", (rank,))
+        conn.commit()
+
+def ensure_search_index(conn):
+    row = conn.execute("SELECT value FROM system_settings WHERE key = 'search_index_version'").fetchone()
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'documents_fts'").fetchone()
+    if exists and row and row['value'] == SEARCH_INDEX_VERSION:
+        for sql in _search_trigger_sql('documents_fts'):
+            conn.execute(sql)
+        _apply_search_weights(conn)
+        return
+    print(f"Reindexing search ({row['value'] if row else 'none'} -> {SEARCH_INDEX_VERSION})")
+    reindex_search_index(conn)
+
+def reindex_search_index(conn=None, batch_size=SEARCH_REINDEX_BATCH, pause=0.0):
+    """
+    Online rebuild with the configured tokenizer, prefixes and weights.
+
+    documents_fts_new is filled in id batches (one short transaction each)
+    while extra triggers mirror live writes into it; search keeps using the
+    current index. The new table is then swapped in with one transaction.
+    Returns the number of documents indexed.
+    """
+    own = conn is None
+    if own:
+        conn = get_db_connection()
+    conn.commit()
+    try:
+        # Leftovers of an interrupted reindex
+        _drop_search_triggers(conn, '_reindex')
+        conn.execute("DROP TABLE IF EXISTS documents_fts_new")
+        conn.execute(_search_table_sql('documents_fts_new'))
+        for sql in _search_trigger_sql('documents_fts_new', '_reindex'):
+            conn.execute(sql)
+        conn.commit()
+
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM documents").fetchone()[0]
+        count = 0
+        # Documents added after this point reach the new table through the triggers
+        for low in range(0, max_id, batch_size):
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM documents_fts_new WHERE rowid > ? AND rowid <= ?", (low, low + batch_size))
+            count += conn.execute(f'''
+                INSERT INTO documents_fts_new(rowid, filename, content, category, tags)
+                SELECT d.id, d.filename, {DOCUMENT_TEXT_SQL}, d.category, d.tags FROM documents d WHERE d.id > ? AND d.id <= ?
+            ''', (low, low + batch_size)).rowcount
+            conn.commit()
+            if pause:
+                time.sleep(pause)
+
+        conn.execute("BEGIN IMMEDIATE")
+        _drop_search_triggers(conn)
+        _drop_search_triggers(conn, '_reindex')
+        conn.execute("DROP TABLE IF EXISTS documents_fts")
+        conn.execute("ALTER TABLE documents_fts_new RENAME TO documents_fts")
+        for sql in _search_trigger_sql('documents_fts'):
+            conn.execute(sql)
+        conn.execute('''
+            INSERT INTO system_settings (key, value) VALUES ('search_index_version', ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+        ''', (SEARCH_INDEX_VERSION,))
+        conn.commit()
+        _apply_search_weights(conn)
+    except sqlite3.Error:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        if own:
+            conn.close()
+
+    optimize_search_index()
+    return count
+
+def optimize_search_index(merge_pages=None):
+    """
+    Merges the index b-trees left behind by incremental updates. With
+    merge_pages, does a bounded 'merge' step (short write lock) instead of a
+    full 'optimize'; returns True once there is nothing left to merge.
+    """
+    conn = get_db_connection()
+    try:
+        if merge_pages:
+            before = conn.total_changes
+            conn.execute("INSERT INTO documents_fts(documents_fts, rank) VALUES ('merge', ?)", (merge_pages,))
+            conn.commit()
+            # A merge step that wrote nothing means the index is fully merged
+            return conn.total_changes - before <= 1
+        conn.execute("INSERT INTO documents_fts(documents_fts) VALUES ('optimize')")
+        conn.commit()
+        return True
+    finally:
+        conn.close()
+
+def build_search_query(text):
+    """
+    FTS5 query for what the user typed: each term quoted, so input such as
+    INV-2024-001 or O'Brien is not read as query syntax, and the last term
+    prefix-matched for type-ahead (the trigram index matches substrings anyway).
+    """
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if not terms:
+        return '""'
+    if SEARCH_TOKENIZER != 'trigram' and len(text.split()[-1]) >= 2:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+# Library listings (get_filtered_documents) filter on one of these columns and
+# order by upload_date, so each index serves both. The partial ones only hold
+# live documents; their WHERE must match the listing's filter text exactly for
+# SQLite to use them. test_query_plans.py checks the plans.
+NOT_DELETED = "(is_deleted = 0 OR is_deleted IS NULL)"
+NOT_SUPERSEDED = "(status != 'Superseded' OR status IS NULL)"
+DOCUMENT_LIBRARY_INDEXES = [
+    ('idx_documents_live_date', f"documents(upload_date) WHERE {NOT_DELETED} AND {NOT_SUPERSEDED}"),
+    ('idx_documents_live_category', f"documents(category, upload_date) WHERE {NOT_DELETED} AND {NOT_SUPERSEDED}"),
+    ('idx_documents_published_date', f"documents(upload_date) WHERE is_published = 1 AND {NOT_DELETED}"),
+    ('idx_documents_ocr_status_date', f"documents(ocr_status, upload_date) WHERE {NOT_DELETED}"),
+    ('idx_documents_approval_date', f"documents(approval_status, upload_date) WHERE {NOT_DELETED}"),
+    ('idx_documents_status_date', "documents(status, upload_date)"),
+    ('idx_documents_batch_date', "documents(batch_id, upload_date)"),
+    ('idx_documents_container_date', "documents(container_id, upload_date)"),
+    ('idx_containers_department', "containers(department)"),
+    ('idx_containers_subsidiary', "containers(subsidiary)"),
+]
+
 def init_db():
     conn = get_db_connection()
+    # Persistent per database file: concurrent readers alongside one writer
+    conn.execute("PRAGMA journal_mode = WAL")
     with conn:
         conn.executescript('''
             CREATE TABLE IF NOT EXISTS documents (
@@ -181,7 +526,6 @@ def init_db():
 
         # Performance Indices (Search Optimization)
         conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_category ON documents(category)")
-        conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_status ON documents(status)")
         conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_upload_date ON documents(upload_date)")
 
         # Create Taxonomy Table
@@ -203,6 +547,12 @@ def init_db():
         except sqlite3.OperationalError:
              pass
 
+        # Classifier keywords for DocumentType terms: 'keyword:weight, keyword, ...'
+        try:
+             conn.execute("ALTER TABLE taxonomy ADD COLUMN keywords TEXT")
+        except sqlite3.OperationalError:
+             pass
+
         # Access Policies Table (Role-Based Access to Confidentiality Levels)
         conn.execute('''
             CREATE TABLE IF NOT EXISTS access_policies (
@@ -256,6 +606,14 @@ def init_db():
                 FOREIGN KEY(document_id) REFERENCES documents(id)
             );
 
+            -- Version text, stored once per distinct content (see save_document_version)
+            CREATE TABLE IF NOT EXISTS text_blobs (
+                hash TEXT PRIMARY KEY, -- sha256 of the UTF-8 text
+                encoding TEXT NOT NULL,
+                body BLOB,
+                size_bytes INTEGER
+            ) WITHOUT ROWID;
+
             CREATE TABLE IF NOT EXISTS audit_log (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 entity_type TEXT,
@@ -287,6 +645,15 @@ def init_db():
             );
         ''')
 
+        # Delta versions: text by hash, other fields as changes since the previous version
+        for col in ('text_hash', 'changes'):
+            try:
+                conn.execute(f'ALTER TABLE document_versions ADD COLUMN {col} TEXT')
+            except sqlite3.OperationalError:
+                pass
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_document_versions_document ON document_versions(document_id, id)")
+        migrate_version_text(conn)
+
         conn.executescript('''
             CREATE TABLE IF NOT EXISTS retention_policies (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -303,37 +670,28 @@ def init_db():
             );
         ''')
 
-        # FR-17: FTS5 Virtual Table for Global Search
+        # OCR text, one row per document (see encode_document_text)
         conn.executescript('''
-            CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
-                id UNINDEXED,
-                filename,
-                content,
-                category,
-                tags
+            CREATE TABLE IF NOT EXISTS document_text (
+                document_id INTEGER PRIMARY KEY,
+                encoding TEXT NOT NULL, -- 'zlib' or 'plain'
+                body BLOB,
+                size_bytes INTEGER, -- uncompressed UTF-8 size
+                updated_at TEXT,
+                FOREIGN KEY(document_id) REFERENCES documents(id)
             );
 
-            -- Triggers to sync FTS table
-            CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
-                INSERT INTO documents_fts(id, filename, content, category, tags)
-                VALUES (new.id, new.filename, new.content, new.category, new.tags);
+            CREATE TRIGGER IF NOT EXISTS documents_ad_text AFTER DELETE ON documents BEGIN
+                DELETE FROM document_text WHERE document_id = old.id;
             END;
 
-            CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
-                DELETE FROM documents_fts WHERE id = old.id;
-            END;
-
-            CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
-                DELETE FROM documents_fts WHERE id = old.id;
-                INSERT INTO documents_fts(id, filename, content, category, tags)
-                VALUES (new.id, new.filename, new.content, new.category, new.tags);
-            END;
+            -- Finds rows still carrying inline content (see migrate_inline_text)
+            CREATE INDEX IF NOT EXISTS idx_documents_inline_text ON documents(id) WHERE content IS NOT NULL;
         ''')
 
-        # Sync existing data to FTS if empty
-        fts_count = conn.execute("SELECT COUNT(*) FROM documents_fts").fetchone()[0]
-        if fts_count == 0:
-            conn.execute("INSERT INTO documents_fts(id, filename, content, category, tags) SELECT id, filename, content, category, tags FROM documents")
+        # FR-17: FTS5 Virtual Table for Global Search
+        ensure_search_index(conn)
+        migrate_inline_text(conn)
 
         # Insert Default Policies if empty
         cursor = conn.execute("SELECT COUNT(*) FROM approval_policies")
@@ -391,6 +749,17 @@ def init_db():
             ]
             conn.executemany("INSERT INTO users (id, name, role, scope, assigned_scope_value, password_hash) VALUES (?, ?, ?, ?, ?, ?)", users)
 
+        # Cached permission contexts (database/permissions.py) reload when this version moves
+        for table in ('users', 'access_policies'):
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_permissions_version AFTER {event} ON {table}
+                    BEGIN
+                        INSERT INTO system_settings (key, value) VALUES ('permissions_version', '1')
+                        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1, updated_at = CURRENT_TIMESTAMP;
+                    END;
+                ''')
+
         # Migration: Add confidentiality_level to documents
         try:
             conn.execute("ALTER TABLE documents ADD COLUMN confidentiality_level TEXT DEFAULT 'Internal'")
@@ -425,6 +794,74 @@ def init_db():
             END;
         ''')
 
+        # Durable Job Queue (OCR / text extraction per page)
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                queue TEXT NOT NULL, -- 'ocr' or 'text'
+                document_id INTEGER,
+                payload TEXT, -- file path of the page to process
+                status TEXT DEFAULT 'Pending', -- 'Pending', 'Leased', 'Done', 'Dead'
+                attempts INTEGER DEFAULT 0,
+                max_attempts INTEGER DEFAULT 5,
+                run_after TEXT,
+                lease_owner TEXT,
+                lease_expires TEXT,
+                heartbeat_at TEXT,
+                last_error TEXT,
+                created_at TEXT,
+                updated_at TEXT,
+                FOREIGN KEY(document_id) REFERENCES documents(id)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_jobs_queue_status ON jobs(queue, status, run_after);
+        ''')
+
+        # OCR Result Cache (content-addressed by page image hash)
+        conn.executescript('''
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                page_hash TEXT NOT NULL, -- sha256 of the page image file
+                engine TEXT NOT NULL,
+                config_version TEXT NOT NULL,
+                text TEXT,
+                confidence REAL,
+                confidence_reason TEXT,
+                words TEXT, -- JSON [[word, conf, left, top, width, height], ...]
+                size_bytes INTEGER,
+                created_at TEXT,
+                last_used_at TEXT,
+                PRIMARY KEY (page_hash, engine, config_version)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache(last_used_at);
+        ''')
+
+        # Access grants: one row per (user, document) with an approved request.
+        # Derived from access_requests; see sync_access_grant.
+        conn.executescript('''
+            CREATE INDEX IF NOT EXISTS idx_access_requests_user_doc ON access_requests(user_id, document_id, status);
+
+            CREATE TABLE IF NOT EXISTS effective_access (
+                user_id TEXT NOT NULL,
+                document_id INTEGER NOT NULL,
+                request_id INTEGER,
+                expires_at TEXT, -- NULL = no expiry
+                PRIMARY KEY (user_id, document_id)
+            ) WITHOUT ROWID;
+
+            CREATE INDEX IF NOT EXISTS idx_effective_access_document ON effective_access(document_id);
+        ''')
+        rebuild_effective_access(conn)
+        expire_access_grants(conn)
+
+        # Library listing indexes (after the column migrations above)
+        for name, definition in DOCUMENT_LIBRARY_INDEXES:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+        # Covered by idx_documents_status_date
+        conn.execute("DROP INDEX IF EXISTS idx_documents_status")
+
+        ensure_analytics_counters(conn)
+
     conn.close()
 
     # Post-Migration: Add status column logic separate from main block if needed, 
@@ -474,6 +911,44 @@ def check_duplicate_hash(file_hash):
     conn.close()
     return dict(doc) if doc else None
 
+def document_text_statement(doc_id, text):
+    """(sql, params) that stores a document's OCR text; None removes it."""
+    if text is None:
+        return ("DELETE FROM document_text WHERE document_id = ?", (doc_id,))
+    encoding, body, size = encode_document_text(text)
+    return ('''
+        INSERT INTO document_text (document_id, encoding, body, size_bytes, updated_at) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(document_id) DO UPDATE SET
+            encoding = excluded.encoding, body = excluded.body, size_bytes = excluded.size_bytes, updated_at = excluded.updated_at
+    ''', (doc_id, encoding, body, size, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+def document_with_text_sql(conn):
+    """SELECT for a full documents row with 'content' read from document_text."""
+    columns = ', '.join('d.' + c for c in sorted(get_document_columns(conn)) if c != 'content')
+    return f"SELECT {columns}, {DOCUMENT_TEXT_SQL} AS content FROM documents d"
+
+def get_document_text(doc_id):
+    conn = get_db_connection()
+    row = conn.execute(f"SELECT {DOCUMENT_TEXT_SQL} AS content FROM documents d WHERE d.id = ?", (doc_id,)).fetchone()
+    conn.close()
+    return row['content'] if row else None
+
+def migrate_inline_text(conn, batch_size=500):
+    """Moves documents.content written by older versions (or scripts writing SQL directly) into document_text."""
+    moved = 0
+    while True:
+        rows = conn.execute("SELECT id, content FROM documents WHERE content IS NOT NULL LIMIT ?", (batch_size,)).fetchall()
+        if not rows:
+            break
+        for row in rows:
+            conn.execute(*document_text_statement(row['id'], row['content']))
+        conn.executemany("UPDATE documents SET content = NULL WHERE id = ?", [(row['id'],) for row in rows])
+        conn.commit()
+        moved += len(rows)
+    if moved:
+        print(f"Moved OCR text of {moved} documents to document_text")
+    return moved
+
 def save_document(filename, category, confidence, content, container_id=None, batch_id=None, ocr_status='Processed', metadata=None, template_type=None, uploader_id=None, tags=None, owner_id=None, content_hash=None, confidence_reason=None, parent_doc_id=None, version_number=1, expiry_date=None, status='Processed'):
     conn = get_db_connection()
     upload_date = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -485,10 +960,12 @@ def save_document(filename, category, confidence, content, container_id=None, ba
 
     with conn:
         cursor = conn.execute('''
-            INSERT INTO documents (filename, category, confidence, content, upload_date, container_id, batch_id, ocr_status, metadata, template_type, uploader_id, tags, uid, owner_id, confidentiality_level, content_hash, confidence_reason, parent_doc_id, version_number, expiry_date, status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (filename, category, confidence, content, upload_date, container_id, batch_id, ocr_status, metadata, template_type, uploader_id, tags, doc_uid, owner_id, 'Internal', content_hash, confidence_reason, parent_doc_id, version_number, expiry_date, status))
-    doc_id = cursor.lastrowid
+            INSERT INTO documents (filename, category, confidence, upload_date, container_id, batch_id, ocr_status, metadata, template_type, uploader_id, tags, uid, owner_id, confidentiality_level, content_hash, confidence_reason, parent_doc_id, version_number, expiry_date, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (filename, category, confidence, upload_date, container_id, batch_id, ocr_status, metadata, template_type, uploader_id, tags, doc_uid, owner_id, 'Internal', content_hash, confidence_reason, parent_doc_id, version_number, expiry_date, status))
+        doc_id = cursor.lastrowid
+        if content is not None:
+            conn.execute(*document_text_statement(doc_id, content))
     
     # Increment container physical page count
     if container_id:
@@ -505,24 +982,161 @@ def save_document(filename, category, confidence, content, container_id=None, ba
     conn.close()
     return doc_id
 
+# Fields captured by save_document_version ('content' is stored as text_hash)
+VERSIONED_FIELDS = ('filename', 'category', 'confidence', 'metadata')
+
+def store_text_blob(conn, text):
+    """Stores text once, keyed by its sha256; returns the hash (None for no text)."""
+    if text is None:
+        return None
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    encoding, body, size = encode_document_text(text)
+    conn.execute("INSERT OR IGNORE INTO text_blobs (hash, encoding, body, size_bytes) VALUES (?, ?, ?, ?)",
+                 (digest, encoding, body, size))
+    return digest
+
+def get_text_blob(conn, digest):
+    if digest is None:
+        return None
+    row = conn.execute("SELECT encoding, body FROM text_blobs WHERE hash = ?", (digest,)).fetchone()
+    return decode_document_text(row['encoding'], row['body']) if row else None
+
+def _metadata_dict(value):
+    try:
+        parsed = json.loads(value) if value else {}
+    except (TypeError, ValueError):
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+def diff_version_fields(previous, current):
+    """
+    Changes from one version state to the next. Metadata that is a JSON object
+    on both sides is diffed per key ({'metadata': {'set': {...}, 'unset': [...]}});
+    other fields are stored whole when they differ.
+    """
+    changes = {}
+    for field in ('filename', 'category', 'confidence'):
+        if previous.get(field) != current.get(field):
+            changes[field] = current.get(field)
+
+    if previous.get('metadata') != current.get('metadata'):
+        old, new = _metadata_dict(previous.get('metadata')), _metadata_dict(current.get('metadata'))
+        if old is None or new is None:
+            changes['metadata'] = {'value': current.get('metadata')}
+        else:
+            changes['metadata'] = {
+                'set': {k: v for k, v in new.items() if k not in old or old[k] != v},
+                'unset': [k for k in old if k not in new]
+            }
+    return changes
+
+def apply_version_changes(state, changes):
+    state = dict(state)
+    for field, value in changes.items():
+        if field != 'metadata':
+            state[field] = value
+        elif 'value' in value:
+            state['metadata'] = value['value']
+        else:
+            metadata = _metadata_dict(state.get('metadata')) or {}
+            metadata.update(value['set'])
+            for key in value['unset']:
+                metadata.pop(key, None)
+            state['metadata'] = json.dumps(metadata)
+    return state
+
+def _version_states(conn, doc_id, up_to=None):
+    """Yields (row, state) for each version of doc_id, oldest first, replaying the changes."""
+    sql = "SELECT * FROM document_versions WHERE document_id = ?"
+    params = [doc_id]
+    if up_to is not None:
+        sql += " AND id <= ?"
+        params.append(up_to)
+    state = {}
+    for row in conn.execute(sql + " ORDER BY id", params).fetchall():
+        if row['changes'] is None:
+            # Full snapshot (written before delta storage)
+            state = {field: row[field] for field in VERSIONED_FIELDS}
+        else:
+            state = apply_version_changes(state, json.loads(row['changes']))
+        state['text_hash'] = row['text_hash']
+        yield row, state
+
 def save_document_version(doc_id, reason, user_id):
     conn = get_db_connection()
-    doc = conn.execute('SELECT * FROM documents WHERE id = ?', (doc_id,)).fetchone()
+    doc = conn.execute(document_with_text_sql(conn) + ' WHERE d.id = ?', (doc_id,)).fetchone()
     if not doc:
         conn.close()
         return False
         
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    current = {field: doc[field] for field in VERSIONED_FIELDS}
+
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        previous = {}
+        for _, previous in _version_states(conn, doc_id):
+            pass
+        changes = diff_version_fields(previous, current)
+        conn.execute('''
+            INSERT INTO document_versions (document_id, text_hash, changes, version_timestamp, reason, user_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (doc_id, store_text_blob(conn, doc['content']), json.dumps(changes), timestamp, reason, user_id))
     
-    conn.execute('''
-        INSERT INTO document_versions (document_id, filename, category, confidence, content, metadata, version_timestamp, reason, user_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (doc_id, doc['filename'], doc['category'], doc['confidence'], doc['content'], doc['metadata'], timestamp, reason, user_id))
-    
-    conn.commit()
     conn.close()
     return True
 
+def get_document_version_history(doc_id):
+    """Saved versions of doc_id, newest first, with the fields each one changed."""
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT id, version_timestamp, reason, user_id, changes,
+               text_hash IS NOT LAG(text_hash) OVER (ORDER BY id) OR ROW_NUMBER() OVER (ORDER BY id) = 1 AS text_changed
+        FROM document_versions
+        WHERE document_id = ? ORDER BY id DESC
+    ''', (doc_id,)).fetchall()
+    conn.close()
+    history = []
+    for row in rows:
+        entry = dict(row)
+        changes = entry.pop('changes')
+        changed = sorted(json.loads(changes)) if changes is not None else list(VERSIONED_FIELDS)
+        if entry.pop('text_changed'):
+            changed.append('content')
+        entry['changed_fields'] = changed
+        history.append(entry)
+    return history
+
+def get_document_version(doc_id, version_id):
+    """The document fields as of version_id, reconstructed from the stored changes; None if unknown."""
+    conn = get_db_connection()
+    result = None
+    for row, state in _version_states(conn, doc_id, up_to=version_id):
+        if row['id'] == version_id:
+            result = {field: state.get(field) for field in VERSIONED_FIELDS}
+            result['content'] = get_text_blob(conn, state.get('text_hash'))
+            result.update(id=row['id'], document_id=doc_id, version_timestamp=row['version_timestamp'],
+                          reason=row['reason'], user_id=row['user_id'])
+    conn.close()
+    return result
+
+def migrate_version_text(conn, batch_size=500):
+    """Moves inline content of full-copy document_versions rows into text_blobs."""
+    moved = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, content FROM document_versions WHERE content IS NOT NULL AND text_hash IS NULL LIMIT ?
+        ''', (batch_size,)).fetchall()
+        if not rows:
+            break
+        conn.executemany("UPDATE document_versions SET text_hash = ?, content = NULL WHERE id = ?",
+                         [(store_text_blob(conn, row['content']), row['id']) for row in rows])
+        conn.commit()
+        moved += len(rows)
+    if moved:
+        print(f"Deduplicated text of {moved} document versions")
+    return moved
+
 def publish_document(doc_id):
     conn = get_db_connection()
     conn.execute("UPDATE documents SET is_published = 1, approval_status = 'Approved' WHERE id = ?", (doc_id,))
@@ -667,14 +1281,17 @@ def get_qc_queue_batches():
     conn.close()
     return batches
 
-def log_audit(entity_type, entity_id, action, details, user, old_value=None, new_value=None, ip_address=None, scope=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def audit_statement(entity_type, entity_id, action, details, user, old_value=None, new_value=None, ip_address=None, scope=None):
+    """The audit_log INSERT as (sql, params), for callers that batch their writes."""
     timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute('''
+    return ('''
         INSERT INTO audit_log (entity_type, entity_id, action, details, performed_by, timestamp, old_value, new_value, ip_address, scope)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (entity_type, entity_id, action, details, user, timestamp, old_value, new_value, ip_address, scope))
+
+def log_audit(entity_type, entity_id, action, details, user, old_value=None, new_value=None, ip_address=None, scope=None):
+    conn = get_db_connection()
+    conn.execute(*audit_statement(entity_type, entity_id, action, details, user, old_value, new_value, ip_address, scope))
     conn.commit()
     conn.close()
 
@@ -757,8 +1374,92 @@ def get_all_containers():
     conn.close()
     return containers
 
-def get_filtered_documents(category=None, start_date=None, end_date=None, search=None, user_id=None, is_admin=False, only_published=False, batch_id=None, status=None, subsidiary=None, department=None, function=None, tags=None, favorite_only=False, container_id=None):
+def encode_page_cursor(doc, search=None):
+    """Opaque keyset token for the row after which the next page starts."""
+    key = [doc.get('upload_date'), doc['id']]
+    if search:
+        key.insert(0, doc.get('relevance'))
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_page_cursor(token, search=None):
+    """Inverse of encode_page_cursor. Raises ValueError for a malformed token."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != (3 if search else 2) or not isinstance(key[-1], int):
+        raise ValueError("Invalid cursor")
+    return key
+
+def _keyset_after_date_id(upload_date, doc_id):
+    # Rows after (upload_date, id) in "upload_date DESC, id DESC" order (NULL dates sort last)
+    if upload_date is None:
+        return "(d.upload_date IS NULL AND d.id < ?)", [doc_id]
+    return "(d.upload_date < ? OR (d.upload_date = ? AND d.id < ?) OR d.upload_date IS NULL)", [upload_date, upload_date, doc_id]
+
+# What the library/search tables show. The heavy columns (content, metadata)
+# are only loaded by get_document unless a caller asks for them.
+DOCUMENT_SUMMARY_FIELDS = (
+    'id', 'filename', 'category', 'upload_date', 'ocr_status', 'status', 'approval_status',
+    'confidence', 'confidence_reason', 'template_type', 'uid', 'uploader_id', 'owner_id',
+    'assigned_to', 'priority', 'sla_status', 'sla_due_date', 'expiry_date', 'tags',
+    'is_published', 'is_deleted', 'batch_id', 'container_id', 'page_count',
+    'confidentiality_level', 'version_number', 'parent_doc_id'
+)
+# Always selected: the keyset cursor is built from them
+DOCUMENT_KEY_FIELDS = ('id', 'upload_date')
+
+_document_columns = None
+
+def get_document_columns(conn):
+    global _document_columns
+    if _document_columns is None:
+        _document_columns = {row['name'] for row in conn.execute("PRAGMA table_info(documents)")}
+    return _document_columns
+
+def parse_document_fields(value):
+    """
+    Parses a `fields=` request value (comma separated documents columns).
+    Returns None when empty (summary projection). Raises ValueError for unknown columns.
+    """
+    if not value:
+        return None
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    conn = get_db_connection()
+    columns = get_document_columns(conn)
+    conn.close()
+    unknown = [f for f in fields if f not in columns]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+def get_filtered_documents(category=None, start_date=None, end_date=None, search=None, user_id=None, is_admin=False, only_published=False, batch_id=None, status=None, subsidiary=None, department=None, function=None, tags=None, favorite_only=False, container_id=None, limit=None, after=None, hide_pending_approval=False, fields=None):
+    """
+    Documents visible to user_id, newest first (best match first when searching).
+
+    Keyset pagination: `limit` caps the number of rows and `after` is a decoded
+    page cursor (see decode_page_cursor) from the last row of the previous page.
+
+    `fields` lists the documents columns to return (DOCUMENT_SUMMARY_FIELDS by
+    default); the joined container/favorite/access columns are always included.
+    """
+    query, params = filtered_documents_query(category, start_date, end_date, search, user_id, is_admin, only_published, batch_id, status, subsidiary, department, function, tags, favorite_only, container_id, limit, after, hide_pending_approval, fields)
     conn = get_db_connection()
+    cursor = conn.execute(query, params)
+    documents = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return documents
+
+def filtered_documents_query(category=None, start_date=None, end_date=None, search=None, user_id=None, is_admin=False, only_published=False, batch_id=None, status=None, subsidiary=None, department=None, function=None, tags=None, favorite_only=False, container_id=None, limit=None, after=None, hide_pending_approval=False, fields=None):
+    """The (sql, params) behind get_filtered_documents."""
+    conn = get_db_connection()
+
+    columns = get_document_columns(conn)
+    selected = list(DOCUMENT_KEY_FIELDS)
+    selected += [f for f in (fields or DOCUMENT_SUMMARY_FIELDS) if f not in selected and f in columns]
+    document_columns = ', '.join(DOCUMENT_TEXT_SQL + ' AS content' if f == 'content' else 'd.' + f for f in selected)
+    # An inner join lets favorites-only listings start from the user's favorites
+    favorites_join = "JOIN" if favorite_only else "LEFT JOIN"
     
     # Base query with JOIN to containers for organization filters
     # Join with favorites to check if current user favorited it
@@ -770,10 +1471,12 @@ def get_filtered_documents(category=None, start_date=None, end_date=None, search
                c.name as container_name
         FROM documents d
         LEFT JOIN containers c ON d.container_id = c.id
-        LEFT JOIN favorites fav ON d.id = fav.document_id AND fav.user_id = ?
+        """ + favorites_join + """ favorites fav ON d.id = fav.document_id AND fav.user_id = ?
+        LEFT JOIN effective_access ea ON ea.document_id = d.id AND ea.user_id = ?
+             AND (ea.expires_at IS NULL OR ea.expires_at >= ?)
         WHERE 1=1
     """
-    params = [user_id]
+    params = [user_id, user_id, access_grant_date()]
     
     # Exclude deleted by default unless looking for them
     if status != 'Soft_Deleted':
@@ -796,57 +1499,12 @@ def get_filtered_documents(category=None, start_date=None, end_date=None, search
         query += " AND d.container_id = ?"
         params.append(container_id)
 
-    # Permission Handling
-    # 1. Get User Role & Scope
-    cursor_user = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    user_role_data = cursor_user.fetchone()
-    
-    # Defaults if user not found (Guest)
-    role = user_role_data['role'] if user_role_data else 'Viewer'
-    scope = user_role_data['scope'] if user_role_data else 'Holding' # Holding means Global
-    scope_val = user_role_data['assigned_scope_value'] if user_role_data else 'KBN Group'
-
-    # 2. Need-to-Know: Department Isolation
-    # If not Admin and scope is limited, strictly filter by container department
-    if role != 'Admin' and not is_admin:
-        if scope == 'Subsidiary':
-            query += " AND c.subsidiary = ?"
-            params.append(scope_val)
-        elif scope == 'Department':
-            # Strict Isolation: Only documents in this Department's containers
-            # OR documents explicitly shared (access_requests)? For now, strict isolation.
-            query += " AND c.department = ?"
-            params.append(scope_val)
-
-        # 3. Confidentiality Clearance (Role-Based)
-        # Fetch allowed levels for this role (Global policy for now, could be Dept specific)
-        policy = conn.execute("SELECT allowed_levels FROM access_policies WHERE role = ? LIMIT 1", (role,)).fetchone()
-        allowed_levels_str = policy['allowed_levels'] if policy else 'Public,Internal'
-        allowed_levels = [l.strip() for l in allowed_levels_str.split(',')]
-        
-        # Build strict filter: (Level IN allowed OR Owner OR Admin OR Access Approved)
-        # Assuming is_admin handles Admin case.
-        # We need to filter rows where:
-        # (effective_confidentiality IN allowed_levels) OR (uploader_id = user) OR (owner_id = user)
-        # Since effective_confidentiality is calculated in SELECT, we might need a WHERE clause using COALESCE(d.confidentiality, c.confidentiality, 'Internal')
-        
-        placeholders = ','.join(['?'] * len(allowed_levels))
-        
-        # We add the permission logic. Note: 'access_status' check logic for specific docs is complex in WHERE.
-        # But we can check access_requests table.
-        
-        # Complex permission block
-        permission_clause = f"""
-            AND (
-                COALESCE(d.confidentiality_level, c.confidentiality_level, 'Internal') IN ({placeholders})
-                OR d.uploader_id = ?
-                OR d.owner_id = ?
-                OR EXISTS (SELECT 1 FROM access_requests ar WHERE ar.document_id = d.id AND ar.user_id = ? AND ar.status = 'Approved')
-            )
-        """
-        query += permission_clause
-        params.extend(allowed_levels)
-        params.extend([user_id, user_id, user_id])
+    # Permission Handling: scope isolation and confidentiality clearance,
+    # compiled once per user (see database/permissions.py)
+    from database.permissions import get_permission_context
+    permission_sql, permission_params = get_permission_context(user_id).document_filter(is_admin)
+    query += permission_sql
+    params.extend(permission_params)
     
     if only_published:
         query += " AND d.is_published = 1"
@@ -895,43 +1553,57 @@ def get_filtered_documents(category=None, start_date=None, end_date=None, search
     if favorite_only:
         query += " AND fav.document_id IS NOT NULL"
 
+    if hide_pending_approval:
+        query += " AND (d.approval_status IS NULL OR d.approval_status != 'Pending Approval')"
+
+    if after and search:
+        keyset, keyset_params = _keyset_after_date_id(after[1], after[2])
+        query += f" AND (f.rank > ? OR (f.rank = ? AND {keyset}))"
+        params.extend([after[0], after[0]] + keyset_params)
+    elif after:
+        keyset, keyset_params = _keyset_after_date_id(after[0], after[1])
+        query += f" AND {keyset}"
+        params.extend(keyset_params)
+
     # Global Search with FTS5 Ranking and Snippet
     if search:
         # We join with FTS table and use MATCH
         # Snippets are generated here. Snippet(table, column_index, start, end, ellipsis, tokens)
         query = """
-            SELECT d.*, c.subsidiary, c.department, c.function, 
+            SELECT """ + document_columns + """, c.subsidiary, c.department, c.function,
                    COALESCE(d.confidentiality_level, c.confidentiality_level, 'Internal') as effective_confidentiality,
                    CASE WHEN fav.document_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite,
-                   snippet(documents_fts, 2, '<b>', '</b>', '...', 15) as ocr_snippet,
+                   snippet(documents_fts, 1, '<b>', '</b>', '...', 15) as ocr_snippet,
                    rank as relevance,
-                   (SELECT status FROM access_requests WHERE user_id = ? AND document_id = d.id AND status = 'Approved') as access_status
+                   CASE WHEN ea.document_id IS NOT NULL THEN 'Approved' END as access_status
             FROM documents d
-            JOIN documents_fts f ON d.id = f.id
+            JOIN documents_fts f ON f.rowid = d.id
             LEFT JOIN containers c ON d.container_id = c.id
-            LEFT JOIN favorites fav ON d.id = fav.document_id AND fav.user_id = ?
+            """ + favorites_join + """ favorites fav ON d.id = fav.document_id AND fav.user_id = ?
+            LEFT JOIN effective_access ea ON ea.document_id = d.id AND ea.user_id = ?
+                 AND (ea.expires_at IS NULL OR ea.expires_at >= ?)
             WHERE f.documents_fts MATCH ? AND """ + query[query.find("WHERE")+6:] # Reuse filters
-        params.insert(0, user_id) # For access_status subquery
-        # params[1] is already user_id (from original params initialization for favorites)
-        params.insert(2, search)
-        query += " ORDER BY relevance ASC, d.upload_date DESC"
+        # params[0:3] are already the favorites/effective_access join values
+        params.insert(3, build_search_query(search))
+        query += " ORDER BY relevance ASC, d.upload_date DESC, d.id DESC"
     else:
         # Non-search query
         # We need to inject the extra columns for confidentiality and access status
         select_clause = """
-            SELECT d.*, c.subsidiary, c.department, c.function,
+            SELECT """ + document_columns + """, c.subsidiary, c.department, c.function,
                    COALESCE(d.confidentiality_level, c.confidentiality_level, 'Internal') as effective_confidentiality,
                    CASE WHEN fav.document_id IS NOT NULL THEN 1 ELSE 0 END as is_favorite,
-                   (SELECT status FROM access_requests WHERE user_id = ? AND document_id = d.id AND status = 'Approved') as access_status
+                   CASE WHEN ea.document_id IS NOT NULL THEN 'Approved' END as access_status
         """
-        params.insert(0, user_id) # For access_status
         query = select_clause + query[query.find("FROM"):]
-        query += " ORDER BY d.upload_date DESC"
-    
-    cursor = conn.execute(query, params)
-    documents = [dict(row) for row in cursor.fetchall()]
+        query += " ORDER BY d.upload_date DESC, d.id DESC"
+
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+
     conn.close()
-    return documents
+    return query, params
 
 def get_users():
     conn = get_db_connection()
@@ -966,57 +1638,138 @@ def get_access_requests(status='Pending'):
     return reqs
 
 def process_access_request(req_id, status, reviewer, expiry=None):
+    """Approve / Reject / Revoke a request; the user's grant for the document follows."""
     conn = get_db_connection()
     date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     conn.execute("UPDATE access_requests SET status = ?, reviewed_by = ?, review_date = ?, expiry_date = ? WHERE id = ?", 
-                 (status, reviewer, date, expiry, req_id))
+                 (status, reviewer, date, expiry or None, req_id))
+    req = conn.execute("SELECT user_id, document_id FROM access_requests WHERE id = ?", (req_id,)).fetchone()
+    if req:
+        sync_access_grant(conn, req['user_id'], req['document_id'])
     conn.commit()
     conn.close()
 
-def get_analytics_stats():
+# A pair's grant is its approved requests folded into one row; any approval
+# without an expiry date makes the grant permanent.
+_ACCESS_GRANT_INSERT = """
+    INSERT INTO effective_access (user_id, document_id, request_id, expires_at)
+    SELECT user_id, document_id, MAX(id),
+           CASE WHEN COUNT(*) > COUNT(NULLIF(expiry_date, '')) THEN NULL ELSE MAX(expiry_date) END
+    FROM access_requests
+    WHERE status = 'Approved' {}
+    GROUP BY user_id, document_id
+"""
+
+def sync_access_grant(conn, user_id, doc_id):
+    """Recomputes one grant from access_requests. Runs in the caller's transaction."""
+    conn.execute("DELETE FROM effective_access WHERE user_id = ? AND document_id = ?", (user_id, doc_id))
+    conn.execute(_ACCESS_GRANT_INSERT.format("AND user_id = ? AND document_id = ?"), (user_id, doc_id))
+
+def rebuild_effective_access(conn):
+    conn.execute("DELETE FROM effective_access")
+    conn.execute(_ACCESS_GRANT_INSERT.format(""))
+
+def access_grant_date():
+    # Grants run through the end of their expiry date (stored as YYYY-MM-DD)
+    return datetime.date.today().isoformat()
+
+def expire_access_grants(conn=None):
+    """Marks approvals past their expiry date as Expired and drops their grants. Returns the number expired."""
+    own = conn is None
+    if own:
+        conn = get_db_connection()
+    today = access_grant_date()
+    expired = conn.execute("""
+        UPDATE access_requests SET status = 'Expired'
+        WHERE status = 'Approved' AND NULLIF(expiry_date, '') IS NOT NULL AND expiry_date < ?
+    """, (today,)).rowcount
+    conn.execute("DELETE FROM effective_access WHERE expires_at < ?", (today,))
+    if own:
+        conn.commit()
+        conn.close()
+    return expired
+
+def has_access_grant(user_id, doc_id):
     conn = get_db_connection()
-    
-    # 1. Total Documents
-    total = conn.execute("SELECT COUNT(*) as count FROM documents").fetchone()['count']
-    
-    # 2. By Category
-    cat_cursor = conn.execute("SELECT category, COUNT(*) as count FROM documents GROUP BY category")
-    by_category = {str(row['category'] or 'Unclassified'): row['count'] for row in cat_cursor.fetchall()}
-    
-    # 3. By Status (OCR Status)
-    try:
-        status_cursor = conn.execute("SELECT ocr_status, COUNT(*) as count FROM documents GROUP BY ocr_status")
-        by_status = {str(row['ocr_status'] or 'Unknown'): row['count'] for row in status_cursor.fetchall()}
-    except Exception as e:
-        print(f"Error in status stats: {e}")
-        by_status = {}
-    except Exception as e:
-        print(f"Error in status stats: {e}")
-        by_status = {}
-    
-    # 4. Daily Throughput
-    try:
-        throughput_cursor = conn.execute("""
-            SELECT date(upload_date) as date, COUNT(*) as count 
-            FROM documents 
-            GROUP BY date(upload_date) 
-            ORDER BY date DESC LIMIT 7
-        """)
-        daily_throughput = [dict(row) for row in throughput_cursor.fetchall()]
-        # Sort manually to be safe? No, SQL handles it.
-        # Check for None dates
-        daily_throughput = [d for d in daily_throughput if d['date']]
-    except Exception as e:
-        print(f"Error in throughput stats: {e}")
-        daily_throughput = []
-    
+    row = conn.execute("""
+        SELECT 1 FROM effective_access
+        WHERE user_id = ? AND document_id = ? AND (expires_at IS NULL OR expires_at >= ?)
+    """, (user_id, doc_id, access_grant_date())).fetchone()
     conn.close()
-    return {
-        "total_documents": total,
-        "by_category": by_category,
-        "by_status": by_status,
-        "daily_throughput": daily_throughput
-    }
+    return row is not None
+
+# Dashboard counters (analytics_counters), one row per (dimension, key),
+# kept current by triggers on documents. Read through utils.analytics.
+ANALYTICS_DIMENSIONS = [
+    ('total', "''"),
+    ('category', "COALESCE(NULLIF({row}.category, ''), 'Unclassified')"),
+    ('status', "COALESCE(NULLIF({row}.ocr_status, ''), 'Unknown')"),
+    ('day', "date({row}.upload_date)"),
+]
+ANALYTICS_COUNTERS_VERSION = '1'
+
+def _analytics_trigger_sql():
+    def add(row, delta):
+        return [f'''
+            INSERT INTO analytics_counters (dimension, key, count)
+            SELECT '{dimension}', {key.format(row=row)}, {delta} WHERE {key.format(row=row)} IS NOT NULL
+            ON CONFLICT(dimension, key) DO UPDATE SET count = count + ({delta});
+        ''' for dimension, key in ANALYTICS_DIMENSIONS]
+
+    return [
+        "CREATE TRIGGER IF NOT EXISTS documents_ai_analytics AFTER INSERT ON documents BEGIN"
+        + ''.join(add('new', 1)) + " END",
+        "CREATE TRIGGER IF NOT EXISTS documents_ad_analytics AFTER DELETE ON documents BEGIN"
+        + ''.join(add('old', -1)) + " END",
+        # Unchanged dimensions net out (-1 then +1 on the same key)
+        """CREATE TRIGGER IF NOT EXISTS documents_au_analytics AFTER UPDATE OF category, ocr_status, upload_date ON documents
+        WHEN old.category IS NOT new.category OR old.ocr_status IS NOT new.ocr_status
+          OR date(old.upload_date) IS NOT date(new.upload_date)
+        BEGIN""" + ''.join(add('old', -1) + add('new', 1)) + " END",
+    ]
+
+def rebuild_analytics_counters(conn):
+    """Recounts analytics_counters from documents and (re)creates its triggers, in one transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for name in ('documents_ai_analytics', 'documents_ad_analytics', 'documents_au_analytics'):
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute("DELETE FROM analytics_counters")
+        for dimension, key in ANALYTICS_DIMENSIONS:
+            key = key.format(row='d')
+            conn.execute(f'''
+                INSERT INTO analytics_counters (dimension, key, count)
+                SELECT '{dimension}', {key}, COUNT(*) FROM documents d WHERE {key} IS NOT NULL GROUP BY {key}
+            ''')
+        for sql in _analytics_trigger_sql():
+            conn.execute(sql)
+        conn.execute('''
+            INSERT INTO system_settings (key, value) VALUES ('analytics_counters_version', ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = CURRENT_TIMESTAMP
+        ''', (ANALYTICS_COUNTERS_VERSION,))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+def ensure_analytics_counters(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_counters (
+            dimension TEXT NOT NULL, -- total, category, status, day
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, key)
+        ) WITHOUT ROWID
+    ''')
+    row = conn.execute("SELECT value FROM system_settings WHERE key = 'analytics_counters_version'").fetchone()
+    if row and row['value'] == ANALYTICS_COUNTERS_VERSION:
+        for sql in _analytics_trigger_sql():
+            conn.execute(sql)
+        return
+    if conn.in_transaction:
+        conn.commit()
+    print(f"Rebuilding analytics counters ({row['value'] if row else 'none'} -> {ANALYTICS_COUNTERS_VERSION})")
+    rebuild_analytics_counters(conn)
 
 def soft_delete_document(doc_id, user_id):
     conn = get_db_connection()
@@ -1083,10 +1836,11 @@ def get_taxonomy(category=None):
     conn.close()
     return items
 
-def add_taxonomy_item(category, value):
+def add_taxonomy_item(category, value, keywords=None):
     conn = get_db_connection()
     try:
-        conn.execute("INSERT INTO taxonomy (category, value) VALUES (?, ?)", (category, value))
+        conn.execute("INSERT INTO taxonomy (category, value, keywords) VALUES (?, ?, ?)", (category, value, keywords))
+        bump_taxonomy_version(conn)
         conn.commit()
         return True
     except sqlite3.IntegrityError:
@@ -1097,9 +1851,41 @@ def add_taxonomy_item(category, value):
 def update_taxonomy_status(item_id, status):
     conn = get_db_connection()
     conn.execute("UPDATE taxonomy SET status = ? WHERE id = ?", (status, item_id))
+    bump_taxonomy_version(conn)
     conn.commit()
     conn.close()
 
+def update_taxonomy_keywords(item_id, keywords):
+    conn = get_db_connection()
+    conn.execute("UPDATE taxonomy SET keywords = ? WHERE id = ?", (keywords, item_id))
+    bump_taxonomy_version(conn)
+    conn.commit()
+    conn.close()
+
+def bump_taxonomy_version(conn):
+    """Marks the taxonomy as changed so classifiers in every process reload it. Caller commits."""
+    conn.execute('''
+        INSERT INTO system_settings (key, value) VALUES ('taxonomy_version', '1')
+        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1, updated_at = CURRENT_TIMESTAMP
+    ''')
+
+def get_taxonomy_version():
+    conn = get_db_connection()
+    row = conn.execute("SELECT value FROM system_settings WHERE key = 'taxonomy_version'").fetchone()
+    conn.close()
+    return row['value'] if row else '0'
+
+def get_classifier_keywords():
+    """Active DocumentType terms that carry classifier keywords."""
+    conn = get_db_connection()
+    rows = conn.execute('''
+        SELECT value, keywords FROM taxonomy
+        WHERE category = 'DocumentType' AND status = 'Active' AND keywords IS NOT NULL AND keywords != ''
+        ORDER BY id
+    ''').fetchall()
+    conn.close()
+    return [dict(row) for row in rows]
+
 def assign_documents(doc_ids, user_id, assigner):
     conn = get_db_connection()
     try:
@@ -1193,9 +1979,13 @@ def get_all_documents():
     conn.close()
     return documents
 
-def get_document(doc_id):
+def get_document(doc_id, with_text=False):
+    """The documents row; the OCR text ('content') is only loaded with with_text."""
     conn = get_db_connection()
-    cursor = conn.execute('SELECT * FROM documents WHERE id = ?', (doc_id,))
+    if with_text:
+        cursor = conn.execute(document_with_text_sql(conn) + ' WHERE d.id = ?', (doc_id,))
+    else:
+        cursor = conn.execute('SELECT * FROM documents WHERE id = ?', (doc_id,))
     row = cursor.fetchone()
     conn.close()
     if row:
@@ -1206,10 +1996,10 @@ def search_documents(query):
     conn = get_db_connection()
     # Search in filename, category, or content
     search_term = f'%{query}%'
-    cursor = conn.execute('''
+    cursor = conn.execute(f'''
         SELECT id, filename, category, confidence, upload_date, status 
-        FROM documents 
-        WHERE filename LIKE ? OR category LIKE ? OR content LIKE ?
+        FROM documents d
+        WHERE filename LIKE ? OR category LIKE ? OR {DOCUMENT_TEXT_SQL} LIKE ?
         ORDER BY upload_date DESC
     ''', (search_term, search_term, search_term))
     
@@ -1270,3 +2060,214 @@ def soft_delete_document(doc_id, user_id):
         return False
     finally:
         conn.close()
+
+# --- Job Queue ---
+# Jobs are leased for a limited time; a worker that dies simply stops sending
+# heartbeats and the job becomes available again once the lease expires.
+
+JOB_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+JOB_RETRY_BASE_SECONDS = 5
+JOB_RETRY_MAX_SECONDS = 600
+
+def _job_time(offset_seconds=0):
+    return (datetime.datetime.now() + datetime.timedelta(seconds=offset_seconds)).strftime(JOB_TIME_FORMAT)
+
+def enqueue_job(queue, document_id, payload, max_attempts=5):
+    conn = get_db_connection()
+    now = _job_time()
+    cursor = conn.execute('''
+        INSERT INTO jobs (queue, document_id, payload, status, attempts, max_attempts, run_after, created_at, updated_at)
+        VALUES (?, ?, ?, 'Pending', 0, ?, ?, ?, ?)
+    ''', (queue, document_id, payload, max_attempts, now, now, now))
+    conn.commit()
+    job_id = cursor.lastrowid
+    conn.close()
+    return job_id
+
+def lease_job(queue, worker_id, lease_seconds=60):
+    """
+    Atomically claims the oldest runnable job on a queue (pending and due, or
+    leased by a worker whose lease has expired). Returns the job dict or None.
+    """
+    conn = get_db_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        now = _job_time()
+        while True:
+            job = conn.execute('''
+                SELECT * FROM jobs
+                WHERE queue = ?
+                  AND ((status = 'Pending' AND run_after <= ?) OR (status = 'Leased' AND lease_expires < ?))
+                ORDER BY id LIMIT 1
+            ''', (queue, now, now)).fetchone()
+            if not job:
+                conn.commit()
+                return None
+
+            if job['status'] == 'Leased' and job['attempts'] >= job['max_attempts']:
+                # Worker died on its last attempt: dead-letter instead of looping forever
+                conn.execute("UPDATE jobs SET status = 'Dead', last_error = ?, updated_at = ? WHERE id = ?",
+                             ('Lease expired on final attempt', now, job['id']))
+                conn.execute("UPDATE documents SET ocr_status = 'Failed' WHERE id = ?", (job['document_id'],))
+                continue
+
+            conn.execute('''
+                UPDATE jobs
+                SET status = 'Leased', lease_owner = ?, lease_expires = ?, heartbeat_at = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+            ''', (worker_id, _job_time(lease_seconds), now, now, job['id']))
+            conn.commit()
+            leased = dict(job)
+            leased['attempts'] += 1
+            leased['status'] = 'Leased'
+            leased['lease_owner'] = worker_id
+            return leased
+    except sqlite3.OperationalError as e:
+        # Another writer holds the lock; the caller will poll again
+        conn.rollback()
+        print(f"Lease failed on queue {queue}: {e}")
+        return None
+    finally:
+        conn.close()
+
+def heartbeat_job(job_id, worker_id, lease_seconds=60):
+    """Extends the lease. Returns False if the job is no longer owned by this worker."""
+    conn = get_db_connection()
+    now = _job_time()
+    cursor = conn.execute('''
+        UPDATE jobs SET lease_expires = ?, heartbeat_at = ?, updated_at = ?
+        WHERE id = ? AND lease_owner = ? AND status = 'Leased'
+    ''', (_job_time(lease_seconds), now, now, job_id, worker_id))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+def complete_job_statement(job_id, worker_id):
+    return ("UPDATE jobs SET status = 'Done', lease_expires = NULL, last_error = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+            (_job_time(), job_id, worker_id))
+
+def complete_job(job_id, worker_id):
+    conn = get_db_connection()
+    conn.execute(*complete_job_statement(job_id, worker_id))
+    conn.commit()
+    conn.close()
+
+def fail_job(job_id, worker_id, error):
+    """
+    Records a failed attempt. Retries with exponential backoff until
+    max_attempts is reached, then dead-letters the job and fails the document.
+    Returns the new job status.
+    """
+    conn = get_db_connection()
+    job = conn.execute("SELECT document_id, attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ?",
+                       (job_id, worker_id)).fetchone()
+    if not job:
+        conn.close()
+        return None
+
+    now = _job_time()
+    if job['attempts'] >= job['max_attempts']:
+        status = 'Dead'
+        conn.execute("UPDATE jobs SET status = 'Dead', lease_expires = NULL, last_error = ?, updated_at = ? WHERE id = ?",
+                     (str(error), now, job_id))
+        conn.execute("UPDATE documents SET ocr_status = 'Failed' WHERE id = ?", (job['document_id'],))
+    else:
+        status = 'Pending'
+        delay = min(JOB_RETRY_BASE_SECONDS * (2 ** (job['attempts'] - 1)), JOB_RETRY_MAX_SECONDS)
+        conn.execute('''
+            UPDATE jobs SET status = 'Pending', lease_owner = NULL, lease_expires = NULL,
+                            run_after = ?, last_error = ?, updated_at = ?
+            WHERE id = ?
+        ''', (_job_time(delay), str(error), now, job_id))
+    conn.commit()
+    conn.close()
+    return status
+
+def count_open_jobs(queue):
+    """Jobs not yet finished (pending, backing off or leased) on a queue."""
+    conn = get_db_connection()
+    count = conn.execute("SELECT COUNT(*) FROM jobs WHERE queue = ? AND status IN ('Pending', 'Leased')", (queue,)).fetchone()[0]
+    conn.close()
+    return count
+
+def get_job_stats():
+    conn = get_db_connection()
+    stats = {}
+    for row in conn.execute("SELECT queue, status, COUNT(*) as count FROM jobs GROUP BY queue, status").fetchall():
+        stats.setdefault(row['queue'], {})[row['status']] = row['count']
+    conn.close()
+    return stats
+
+def get_dead_jobs(limit=100):
+    conn = get_db_connection()
+    jobs = [dict(row) for row in conn.execute("SELECT * FROM jobs WHERE status = 'Dead' ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()]
+    conn.close()
+    return jobs
+
+def retry_dead_job(job_id):
+    conn = get_db_connection()
+    now = _job_time()
+    cursor = conn.execute('''
+        UPDATE jobs SET status = 'Pending', attempts = 0, lease_owner = NULL, lease_expires = NULL,
+                        run_after = ?, updated_at = ?
+        WHERE id = ? AND status = 'Dead'
+    ''', (now, now, job_id))
+    if cursor.rowcount:
+        conn.execute("UPDATE documents SET ocr_status = 'Queued' WHERE id = (SELECT document_id FROM jobs WHERE id = ?)", (job_id,))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount > 0
+
+def purge_finished_jobs(days=7):
+    conn = get_db_connection()
+    cutoff = _job_time(-days * 86400)
+    conn.execute("DELETE FROM jobs WHERE status = 'Done' AND updated_at < ?", (cutoff,))
+    conn.commit()
+    conn.close()
+
+# --- OCR Result Cache ---
+
+# Eviction is LRU at a coarse grain: a hit refreshes last_used_at at most this often
+OCR_CACHE_TOUCH_SECONDS = int(os.environ.get('KBN_OCR_CACHE_TOUCH_SECONDS', 3600))
+
+def get_cached_ocr(page_hash, engine, config_version):
+    conn = get_db_connection()
+    row = conn.execute("SELECT * FROM ocr_cache WHERE page_hash = ? AND engine = ? AND config_version = ?",
+                       (page_hash, engine, config_version)).fetchone()
+    conn.close()
+    if row and (row['last_used_at'] or '') < _job_time(-OCR_CACHE_TOUCH_SECONDS):
+        # Not waited on: the hit does not need the write to land
+        from database.write_batcher import get_write_batcher
+        get_write_batcher().submit([(
+            "UPDATE ocr_cache SET last_used_at = ? WHERE page_hash = ? AND engine = ? AND config_version = ?",
+            (_job_time(), page_hash, engine, config_version)
+        )])
+    return dict(row) if row else None
+
+def put_cached_ocr(page_hash, engine, config_version, text, confidence, confidence_reason, words):
+    size_bytes = len(text or '') + len(words or '')
+    now = _job_time()
+    conn = get_db_connection()
+    conn.execute('''
+        INSERT OR REPLACE INTO ocr_cache
+            (page_hash, engine, config_version, text, confidence, confidence_reason, words, size_bytes, created_at, last_used_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (page_hash, engine, config_version, text, confidence, confidence_reason, words, size_bytes, now, now))
+    conn.commit()
+    conn.close()
+
+def evict_ocr_cache(max_bytes):
+    """Drops least recently used entries until the cache fits in max_bytes. Returns rows removed."""
+    conn = get_db_connection()
+    cursor = conn.execute('''
+        DELETE FROM ocr_cache WHERE rowid IN (
+            SELECT rowid FROM (
+                SELECT rowid, SUM(size_bytes) OVER (ORDER BY last_used_at DESC, rowid DESC) AS running
+                FROM ocr_cache
+            ) WHERE running > ?
+        )
+    ''', (max_bytes,))
+    conn.commit()
+    conn.close()
+    return cursor.rowcount
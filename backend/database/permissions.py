@@ -0,0 +1,113 @@
+import os
+import time
+import threading
+from database.db import get_db_connection
+
+# How often cached contexts check whether users / access_policies changed
+PERMISSION_RECHECK_SECONDS = int(os.environ.get('KBN_PERMISSION_RECHECK_SECONDS', 30))
+MAX_CACHED_CONTEXTS = 4096
+
+# Unknown users (Guest) browse as a global Viewer
+GUEST_ROLE = 'Viewer'
+GUEST_SCOPE = 'Holding'
+GUEST_SCOPE_VALUE = 'KBN Group'
+DEFAULT_ALLOWED_LEVELS = 'Public,Internal'
+
+class PermissionContext:
+    """
+    Role, scope and clearance of one user, with the document listing predicate
+    compiled once. The predicate expects the aliases used by
+    get_filtered_documents: d (documents), c (containers), ea (effective_access).
+    """
+
+    def __init__(self, user_id, role, scope, scope_value, allowed_levels):
+        self.user_id = user_id
+        self.role = role
+        self.scope = scope
+        self.scope_value = scope_value
+        self.allowed_levels = allowed_levels
+        self.is_admin = role == 'Admin'
+        self.predicate, self.params = self._compile()
+
+    def _compile(self):
+        if self.is_admin:
+            return "", []
+        sql = ""
+        params = []
+        # Need-to-Know: limited scopes only see their own containers
+        if self.scope == 'Subsidiary':
+            sql += " AND c.subsidiary = ?"
+            params.append(self.scope_value)
+        elif self.scope == 'Department':
+            sql += " AND c.department = ?"
+            params.append(self.scope_value)
+
+        # Clearance: level allowed for the role, or own document, or granted access
+        placeholders = ','.join(['?'] * len(self.allowed_levels))
+        sql += f"""
+            AND (
+                COALESCE(d.confidentiality_level, c.confidentiality_level, 'Internal') IN ({placeholders})
+                OR d.uploader_id = ?
+                OR d.owner_id = ?
+                OR ea.document_id IS NOT NULL
+            )
+        """
+        params.extend(self.allowed_levels)
+        params.extend([self.user_id, self.user_id])
+        return sql, params
+
+    def document_filter(self, is_admin=False):
+        """(sql, params) to append to the listing WHERE clause; empty for admins."""
+        if is_admin:
+            return "", []
+        return self.predicate, list(self.params)
+
+def load_permission_context(user_id):
+    conn = get_db_connection()
+    user = conn.execute("SELECT role, scope, assigned_scope_value FROM users WHERE id = ?", (user_id,)).fetchone()
+    role = user['role'] if user else GUEST_ROLE
+    scope = user['scope'] if user else GUEST_SCOPE
+    scope_value = user['assigned_scope_value'] if user else GUEST_SCOPE_VALUE
+    policy = conn.execute("SELECT allowed_levels FROM access_policies WHERE role = ? LIMIT 1", (role,)).fetchone()
+    conn.close()
+    levels = (policy['allowed_levels'] if policy else None) or DEFAULT_ALLOWED_LEVELS
+    return PermissionContext(user_id, role, scope, scope_value, [l.strip() for l in levels.split(',')])
+
+_cache = {'contexts': {}, 'version': None, 'checked_at': 0.0}
+_cache_lock = threading.Lock()
+
+def _get_permissions_version():
+    conn = get_db_connection()
+    row = conn.execute("SELECT value FROM system_settings WHERE key = 'permissions_version'").fetchone()
+    conn.close()
+    return row['value'] if row else '0'
+
+def get_permission_context(user_id):
+    """
+    Cached PermissionContext for user_id. Triggers on users / access_policies
+    bump 'permissions_version'; the cache is dropped when it changes (checked
+    at most every PERMISSION_RECHECK_SECONDS).
+    """
+    now = time.time()
+    if now - _cache['checked_at'] >= PERMISSION_RECHECK_SECONDS:
+        version = _get_permissions_version()
+        with _cache_lock:
+            if version != _cache['version']:
+                _cache['contexts'] = {}
+                _cache['version'] = version
+            _cache['checked_at'] = now
+
+    context = _cache['contexts'].get(user_id)
+    if context is None:
+        context = load_permission_context(user_id)
+        with _cache_lock:
+            if len(_cache['contexts']) >= MAX_CACHED_CONTEXTS:
+                _cache['contexts'] = {}
+            _cache['contexts'][user_id] = context
+    return context
+
+def invalidate_permission_cache():
+    """Drops every cached context; call after changing users or access_policies."""
+    with _cache_lock:
+        _cache['contexts'] = {}
+        _cache['checked_at'] = 0.0
@@ -0,0 +1,116 @@
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from database.db import get_db_connection
+
+FLUSH_INTERVAL_MS = int(os.environ.get('KBN_DB_FLUSH_MS', 50))
+MAX_BATCH = int(os.environ.get('KBN_DB_MAX_BATCH', 500))
+
+class WriteBatcher:
+    """
+    Single writer thread for the processing pipeline.
+
+    Workers submit a unit of work (a list of (sql, params) statements that must
+    apply together) and get a Future back. The writer collects whatever arrives
+    within the flush interval and commits it as one transaction, so many pages
+    share one fsync. Each unit runs in its own savepoint: a unit that fails is
+    rolled back and its Future gets the exception, the rest still commit.
+
+    Units are applied in submission order. `after` makes a unit fail if an
+    earlier unit failed (e.g. do not mark a job done if its page writes failed).
+    """
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL_MS / 1000.0, max_batch=MAX_BATCH):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, statements, after=None):
+        future = Future()
+        self.queue.put((list(statements), after, future))
+        self._ensure_started()
+        return future
+
+    def write(self, statements):
+        """Submits and waits for the commit. Returns the rowcount of each statement."""
+        return self.submit(statements).result()
+
+    def _ensure_started(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                t = threading.Thread(target=self._run, name="db-write-batcher")
+                t.daemon = True
+                t.start()
+                self.thread = t
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # Never let the writer thread die: waiting workers would block forever
+                print(f"[WriteBatcher] Flush of {len(batch)} units failed: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _flush(self, batch):
+        outcomes = {}  # id(future) -> (result, error)
+        conn = get_db_connection()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for statements, after, future in batch:
+                if after is not None:
+                    error = outcomes[id(after)][1] if id(after) in outcomes else (after.done() and after.exception())
+                    if error:
+                        outcomes[id(future)] = (None, error)
+                        continue
+                conn.execute("SAVEPOINT unit")
+                try:
+                    result = [conn.execute(sql, params).rowcount for sql, params in statements]
+                    conn.execute("RELEASE unit")
+                    outcomes[id(future)] = (result, None)
+                except Exception as e:
+                    # sqlite3.Error, or e.g. a parameter that cannot be bound
+                    conn.execute("ROLLBACK TO unit")
+                    conn.execute("RELEASE unit")
+                    outcomes[id(future)] = (None, e)
+            conn.commit()
+        except Exception as e:
+            # Could not get the write lock (or commit): the whole batch failed
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"[WriteBatcher] Batch of {len(batch)} failed: {e}")
+            outcomes = {id(future): (None, e) for _, _, future in batch}
+        finally:
+            conn.close()
+
+        for _, _, future in batch:
+            result, error = outcomes.get(id(future), (None, RuntimeError("Unit was not applied")))
+            if future.done():
+                continue
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+_batcher = WriteBatcher()
+
+def get_write_batcher():
+    return _batcher
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import random
+import tempfile
+import datetime
+import importlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import database.db as db
+
+# What /analytics ran per request before the counters: reload database.db,
+# then group the whole documents table
+LEGACY_QUERIES = [
+    "SELECT COUNT(*) as count FROM documents",
+    "SELECT category, COUNT(*) as count FROM documents GROUP BY category",
+    "SELECT ocr_status, COUNT(*) as count FROM documents GROUP BY ocr_status",
+    "SELECT date(upload_date) as date, COUNT(*) as count FROM documents GROUP BY date(upload_date) ORDER BY date DESC LIMIT 7",
+]
+
+def legacy_request():
+    path = db.DB_NAME
+    module = importlib.reload(db)
+    module.DB_NAME = path # reload resets it to the default
+    conn = module.get_db_connection()
+    for sql in LEGACY_QUERIES:
+        conn.execute(sql).fetchall()
+    conn.close()
+
+def seed(count):
+    conn = db.get_db_connection()
+    start = datetime.datetime(2025, 1, 1)
+    rows = [(f"doc_{i}.pdf", random.choice(['Invoice', 'Contract', 'Memo', 'Receipt', None]),
+             random.choice(['Completed', 'Pending', 'Failed']),
+             (start + datetime.timedelta(minutes=7 * i)).strftime("%Y-%m-%d %H:%M:%S")) for i in range(count)]
+    conn.executemany("INSERT INTO documents (filename, category, ocr_status, upload_date) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+def measure(label, fn, requests):
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(f"{label:<28} mean {sum(timings) / len(timings):8.3f} ms   p50 {timings[len(timings) // 2]:8.3f} ms   p95 {timings[int(len(timings) * 0.95)]:8.3f} ms")
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Per-request latency of /analytics, before and after the counters service")
+    parser.add_argument('--docs', type=int, default=50000, help="Documents to seed into a scratch database")
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    db.DB_NAME = os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    db.init_db()
+    seed(args.docs)
+
+    from utils import analytics
+    print(f"{args.docs} documents, {args.requests} requests")
+    measure("before (reload + GROUP BY)", legacy_request, args.requests)
+    measure("after (counters, uncached)", analytics.load_analytics_stats, args.requests)
+    measure("after (cached)", analytics.get_analytics_stats, args.requests)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+import functools
+
+# Run from the same working directory as app.py so documents.db and uploads/ resolve identically
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from database.db import init_db, purge_finished_jobs
+from utils.processing import run_processing_job
+from utils.worker_pool import WorkerPool
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="KBN Document Processing Worker")
+    parser.add_argument('--queues', type=str, default='ocr,text', help="Comma separated queues to consume")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) - 1), help="Worker threads per queue")
+    parser.add_argument('--upload-folder', type=str, default=os.path.join(os.getcwd(), 'uploads'))
+    parser.add_argument('--lease', type=int, default=60, help="Job lease in seconds")
+    args = parser.parse_args()
+
+    init_db()
+    purge_finished_jobs()
+
+    pool = WorkerPool(functools.partial(run_processing_job, upload_folder=args.upload_folder), lease_seconds=args.lease)
+    for name in [q.strip() for q in args.queues.split(',') if q.strip()]:
+        # Capacity only matters for intake backpressure, which happens in app.py
+        pool.add_queue(name, args.workers, 1)
+
+    print(f"[{pool.worker_prefix}] Consuming {', '.join(pool.queues)} with {args.workers} worker(s) each. Ctrl+C to stop.")
+    pool.start()
+    try:
+        while True:
+            time.sleep(60)
+            print(f"[{pool.worker_prefix}] {pool.stats()}")
+    except KeyboardInterrupt:
+        # Leases of in-flight jobs expire and another worker resumes them
+        print("Stopping worker.")
+
+if __name__ == "__main__":
+    main()
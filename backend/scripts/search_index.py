@@ -0,0 +1,36 @@
+import os
+import sys
+import time
+
+# Run from the same working directory as app.py so documents.db resolves identically
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from database.db import init_db, reindex_search_index, optimize_search_index, SEARCH_INDEX_VERSION
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="KBN search index (documents_fts) maintenance")
+    parser.add_argument('command', choices=['reindex', 'optimize', 'merge'],
+                        help="reindex: online rebuild with the KBN_FTS_* settings; optimize: full merge; merge: incremental merge in small steps")
+    parser.add_argument('--batch', type=int, default=2000, help="Documents per reindex transaction")
+    parser.add_argument('--pages', type=int, default=500, help="Pages per merge step")
+    parser.add_argument('--pause', type=float, default=0.2, help="Seconds between reindex batches / merge steps, so writers get the lock")
+    args = parser.parse_args()
+
+    init_db()
+    started = time.time()
+
+    if args.command == 'reindex':
+        count = reindex_search_index(batch_size=args.batch, pause=args.pause)
+        print(f"Indexed {count} documents ({SEARCH_INDEX_VERSION}) in {time.time() - started:.1f}s")
+    elif args.command == 'optimize':
+        optimize_search_index()
+        print(f"Optimized in {time.time() - started:.1f}s")
+    else:
+        steps = 1
+        while not optimize_search_index(merge_pages=args.pages):
+            steps += 1
+            time.sleep(args.pause)
+        print(f"Merged in {steps} step(s), {time.time() - started:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,7 @@ import sys
 # Add backend to path to import app if needed, or just use DB directly for setup
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from database.db import get_db_connection, save_document, request_access
-from app import process_document_background
+from utils.processing import process_document_background
 
 def setup_test_data():
     conn = get_db_connection()
@@ -0,0 +1,92 @@
+import unittest
+import os
+import tempfile
+from database import db
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.old_db = db.DB_NAME
+        db.DB_NAME = os.path.join(self.tmpdir, 'jobs_test.db')
+        db.init_db()
+        self.doc_id = db.save_document('page_1.png', 'Unclassified', 0.0, 'OCR Pending...', ocr_status='Queued')
+
+    def tearDown(self):
+        db.DB_NAME = self.old_db
+
+    def expire_backoff(self, job_id):
+        conn = db.get_db_connection()
+        conn.execute("UPDATE jobs SET run_after = '2000-01-01 00:00:00' WHERE id = ?", (job_id,))
+        conn.commit()
+        conn.close()
+
+    def test_lease_is_exclusive_and_completes(self):
+        job_id = db.enqueue_job('ocr', self.doc_id, 'page_1.png')
+        job = db.lease_job('ocr', 'worker-a')
+        self.assertEqual(job['id'], job_id)
+        self.assertEqual(job['attempts'], 1)
+        # Nothing left for a second worker while the lease is live
+        self.assertIsNone(db.lease_job('ocr', 'worker-b'))
+
+        db.complete_job(job_id, 'worker-a')
+        self.assertEqual(db.count_open_jobs('ocr'), 0)
+
+    def test_expired_lease_is_resumed_by_another_worker(self):
+        job_id = db.enqueue_job('ocr', self.doc_id, 'page_1.png')
+        db.lease_job('ocr', 'crashed-worker', lease_seconds=-1)
+
+        job = db.lease_job('ocr', 'worker-b')
+        self.assertEqual(job['id'], job_id)
+        self.assertEqual(job['lease_owner'], 'worker-b')
+        # The crashed worker can no longer heartbeat or complete it
+        self.assertFalse(db.heartbeat_job(job_id, 'crashed-worker'))
+
+    def test_retry_backoff_then_dead_letter(self):
+        job_id = db.enqueue_job('ocr', self.doc_id, 'page_1.png', max_attempts=2)
+
+        job = db.lease_job('ocr', 'worker-a')
+        self.assertEqual(db.fail_job(job['id'], 'worker-a', 'boom'), 'Pending')
+        # Backing off: not leasable until run_after passes
+        self.assertIsNone(db.lease_job('ocr', 'worker-a'))
+
+        self.expire_backoff(job_id)
+        job = db.lease_job('ocr', 'worker-a')
+        self.assertEqual(db.fail_job(job['id'], 'worker-a', 'boom'), 'Dead')
+        self.assertEqual(db.get_document(self.doc_id)['ocr_status'], 'Failed')
+
+        self.assertTrue(db.retry_dead_job(job_id))
+        self.assertEqual(db.lease_job('ocr', 'worker-a')['id'], job_id)
+
+    def test_write_batcher_survives_non_sqlite_errors(self):
+        from database.write_batcher import WriteBatcher
+        batcher = WriteBatcher(flush_interval=0.01)
+        # An int too large for SQLite raises OverflowError while binding
+        bad = batcher.submit([("UPDATE documents SET confidence = ? WHERE id = ?", (2 ** 70, self.doc_id))])
+        good = batcher.submit([("UPDATE documents SET ocr_status = 'Done' WHERE id = ?", (self.doc_id,))])
+        with self.assertRaises(OverflowError):
+            bad.result(timeout=5)
+        self.assertEqual(good.result(timeout=5), [1])
+        # The writer thread is still serving
+        self.assertEqual(batcher.write([("UPDATE documents SET ocr_status = 'Again' WHERE id = ?", (self.doc_id,))]), [1])
+
+    def test_pool_reservations_hold_capacity_until_enqueued(self):
+        from utils.worker_pool import WorkerPool
+        pool = WorkerPool(handler=None)
+        pool.add_queue('ocr', 1, 3)
+        # A burst on an idle queue: the first upload is admitted, the second
+        # sees its reservation even though no job row exists yet
+        self.assertTrue(pool.reserve('ocr', 2))
+        self.assertFalse(pool.reserve('ocr', 2))
+
+        pool.submit('ocr', self.doc_id, 'page_1.png')
+        pool.submit('ocr', self.doc_id, 'page_2.png')
+        self.assertEqual(pool.stats()['ocr']['reserved'], 0)
+        self.assertTrue(pool.reserve('ocr', 1))
+        self.assertFalse(pool.reserve('ocr', 1))
+        pool.release('ocr', 1)
+        self.assertTrue(pool.reserve('ocr', 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
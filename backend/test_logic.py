@@ -2,7 +2,7 @@ import unittest
 import os
 import shutil
 import json
-from utils.extraction import extract_invoice_metadata
+from utils.extraction import extract_invoice_metadata, FieldSpec, Extractor
 from utils.renaming import process_rename_and_move
 
 class TestWorkflowLogic(unittest.TestCase):
@@ -29,6 +29,17 @@ class TestWorkflowLogic(unittest.TestCase):
         # Issuing company heuristic: First line
         self.assertEqual(data.get('issuing_company'), 'KBN Services')
 
+    def test_combined_scan_keeps_literal_parens(self):
+        # Specs are OR-ed into one regex with their groups made non-capturing;
+        # escaped and bracketed parens must stay literal
+        specs = [
+            FieldSpec(r'Total \((?:USD|AED)\):\s*([\d.]+)', {'total': 1}),
+            FieldSpec(r'Ref [(](\d+)[)]', {'ref': 1}),
+        ]
+        result = Extractor(specs).run("Ref (42) ... Total (AED): 99.50")
+        self.assertEqual(result['total']['value'], '99.50')
+        self.assertEqual(result['ref']['value'], '42')
+
     def test_renaming_logic(self):
         # Setup dummy file
         dummy_file = "test_doc.pdf"
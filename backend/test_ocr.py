@@ -0,0 +1,28 @@
+import unittest
+import threading
+from utils import ocr
+
+def tesserocr_usable():
+    # Installed, and with language data for the configured language
+    return ocr.tesserocr is not None and ocr.OCR_LANG in ocr.tesserocr.get_languages()[1]
+
+class TestOcrEngine(unittest.TestCase):
+
+    def engine_in_new_thread(self):
+        # Engines are per thread; a fresh thread builds one from scratch
+        engines = []
+        t = threading.Thread(target=lambda: engines.append(ocr.get_ocr_engine()))
+        t.start()
+        t.join()
+        return engines[0]
+
+    @unittest.skipUnless(tesserocr_usable(), "tesserocr or its language data is not installed")
+    def test_persistent_engine_is_used_when_tesserocr_is_installed(self):
+        self.assertIsInstance(self.engine_in_new_thread(), ocr.TesserocrEngine)
+
+    @unittest.skipIf(tesserocr_usable(), "tesserocr is usable")
+    def test_falls_back_to_pytesseract(self):
+        self.assertIsInstance(self.engine_in_new_thread(), ocr.PytesseractEngine)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import os
+import re
+import itertools
+import tempfile
+from database import db
+
+# One entry per listing filter (get_filtered_documents keyword arguments)
+FILTERS = [
+    {},
+    {'category': 'Invoice'},
+    {'status': 'Pending'},
+    {'status': 'Completed'},
+    {'status': 'Published'},
+    {'status': 'Soft_Deleted'},
+    {'status': 'Archived'},
+    {'batch_id': 'BATCH-1'},
+    {'container_id': 'DEPT-HR'},
+    {'department': 'HR'},
+    {'subsidiary': 'KBN North'},
+    {'function': 'Payroll'},
+    {'start_date': '2025-01-01', 'end_date': '2025-02-01'},
+    {'tags': 'urgent'},
+    {'favorite_only': True},
+    {'only_published': True},
+    {'hide_pending_approval': True},
+    {'search': 'invoice'},
+]
+
+USERS = [
+    {'user_id': 'Gokul_Admin', 'is_admin': True},
+    {'user_id': 'Viewer_Tom'},      # Department scope
+    {'user_id': 'Manager_Dave'},    # Subsidiary scope
+    {'user_id': 'Guest'},
+]
+
+# A table scan shows up as "SCAN d" without "USING [COVERING] INDEX"
+FULL_SCAN = re.compile(r'\bSCAN (d|c|fav|ea)\b(?! USING)')
+
+class TestLibraryQueryPlans(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.old_db = db.DB_NAME
+        db.DB_NAME = os.path.join(self.tmpdir, 'plans_test.db')
+        db.init_db()
+
+    def tearDown(self):
+        db.DB_NAME = self.old_db
+
+    def plan(self, **kwargs):
+        query, params = db.filtered_documents_query(limit=101, **kwargs)
+        conn = db.get_db_connection()
+        rows = conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+        conn.close()
+        return ' | '.join(row['detail'] for row in rows)
+
+    def combinations(self):
+        for first, second in itertools.combinations(FILTERS, 2):
+            if set(first) & set(second):
+                continue
+            yield dict(first, **second)
+
+    def test_no_listing_filter_combination_scans_a_table(self):
+        for user in USERS:
+            for filters in [*FILTERS, *self.combinations()]:
+                plan = self.plan(**user, **filters)
+                self.assertIsNone(FULL_SCAN.search(plan), f"{user} {filters}: {plan}")
+
+    def test_next_page_uses_an_index(self):
+        for filters in FILTERS:
+            after = [-1.0, '2025-01-01', 100] if filters.get('search') else ['2025-01-01', 100]
+            plan = self.plan(is_admin=True, after=after, **filters)
+            self.assertIsNone(FULL_SCAN.search(plan), f"{filters}: {plan}")
+
+    def test_default_library_page_reads_in_index_order(self):
+        # The live-documents index serves both the filter and the ORDER BY
+        plan = self.plan(is_admin=True)
+        self.assertIn('idx_documents_live_date', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+if __name__ == '__main__':
+    unittest.main()
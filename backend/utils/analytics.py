@@ -0,0 +1,47 @@
+import os
+import time
+import threading
+from database.db import get_db_connection
+
+# Dashboard statistics, read from analytics_counters (maintained by triggers,
+# see database.db.ensure_analytics_counters). The statements are fixed
+# strings, so each thread's connection prepares them once and reuses the plan
+# from its statement cache.
+ANALYTICS_CACHE_SECONDS = float(os.environ.get('KBN_ANALYTICS_CACHE_SECONDS', 10))
+THROUGHPUT_DAYS = 7
+
+COUNTERS_SQL = "SELECT dimension, key, count FROM analytics_counters WHERE dimension IN ('total', 'category', 'status') AND count > 0"
+THROUGHPUT_SQL = """
+    SELECT key AS date, count FROM analytics_counters
+    WHERE dimension = 'day' AND count > 0
+    ORDER BY key DESC LIMIT ?
+"""
+
+def load_analytics_stats():
+    conn = get_db_connection()
+    counters = {'total': {}, 'category': {}, 'status': {}}
+    for row in conn.execute(COUNTERS_SQL):
+        counters[row['dimension']][row['key']] = row['count']
+    daily_throughput = [dict(row) for row in conn.execute(THROUGHPUT_SQL, (THROUGHPUT_DAYS,))]
+    conn.close()
+    return {
+        "total_documents": counters['total'].get('', 0),
+        "by_category": counters['category'],
+        "by_status": counters['status'],
+        "daily_throughput": daily_throughput
+    }
+
+_cache = {'stats': None, 'loaded_at': 0.0}
+_cache_lock = threading.Lock()
+
+def get_analytics_stats():
+    """Dashboard totals, cached for ANALYTICS_CACHE_SECONDS."""
+    with _cache_lock:
+        if _cache['stats'] is None or time.time() - _cache['loaded_at'] >= ANALYTICS_CACHE_SECONDS:
+            _cache['stats'] = load_analytics_stats()
+            _cache['loaded_at'] = time.time()
+        return _cache['stats']
+
+def invalidate_analytics_cache():
+    with _cache_lock:
+        _cache['stats'] = None
@@ -1,25 +1,139 @@
+import re
+import time
+import threading
+
+# Built-in rules, in priority order (earlier wins a tie): (category, confidence, {keyword: weight})
+DEFAULT_CATEGORY_KEYWORDS = [
+    ('Invoice', 0.95, {'invoice': 3, 'tax invoice': 4, 'bill to': 2, 'amount due': 2}),
+    # Receipt / Invoice overlap, but 'receipt' keyword usually distinct for POS
+    ('Receipt', 0.85, {'receipt': 3, 'transaction': 1, 'payment': 1, 'total': 1}),
+    ('Contract', 0.90, {'contract': 3, 'agreement': 3, 'undersigned': 2, 'parties': 1}),
+    ('Report', 0.80, {'report': 2, 'summary': 1, 'analysis': 1, 'status': 1}),
+]
+TAXONOMY_CONFIDENCE = 0.80      # For DocumentType terms that only exist in the taxonomy
+TAXONOMY_RECHECK_SECONDS = 30   # How often to look for taxonomy changes
+
+def parse_keywords(spec):
+    """'keyword:weight, keyword' -> {keyword: weight}. Weight defaults to 1."""
+    keywords = {}
+    for item in (spec or '').split(','):
+        keyword, _, weight = item.partition(':')
+        keyword = ' '.join(keyword.lower().split())
+        if not keyword:
+            continue
+        try:
+            keywords[keyword] = float(weight) if weight.strip() else 1.0
+        except ValueError:
+            keywords[keyword] = 1.0
+    return keywords
+
+class ClassifierEngine:
+    """
+    All category keywords compiled into one regex, so a document is scored
+    against every category in a single pass over its text.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules  # [(category, confidence, {keyword: weight})] in priority order
+        self.priority = {category: i for i, (category, _, _) in enumerate(rules)}
+        self.confidence = {category: conf for category, conf, _ in rules}
+        self.keyword_map = {}  # keyword -> [(category, weight)]
+        for category, _, keywords in rules:
+            for keyword, weight in keywords.items():
+                self.keyword_map.setdefault(keyword, []).append((category, weight))
+
+        # Longest first so 'tax invoice' wins over 'invoice'; spaces match any
+        # whitespace since OCR breaks phrases across lines
+        alternatives = [
+            r'\s+'.join(re.escape(part) for part in keyword.split())
+            for keyword in sorted(self.keyword_map, key=len, reverse=True)
+        ]
+        self.pattern = re.compile(r'\b(?:' + '|'.join(alternatives) + ')', re.IGNORECASE) if alternatives else None
+
+    def rank(self, text):
+        """
+        Returns candidates sorted best first:
+        [{'category', 'score', 'confidence', 'keywords'}]. Each keyword counts once.
+        """
+        if not text or not self.pattern:
+            return []
+        seen = set()
+        for match in self.pattern.finditer(text):
+            seen.add(' '.join(match.group(0).lower().split()))
+
+        scores = {}
+        for keyword in seen:
+            for category, weight in self.keyword_map.get(keyword, []):
+                entry = scores.setdefault(category, {'score': 0.0, 'keywords': []})
+                entry['score'] += weight
+                entry['keywords'].append(keyword)
+
+        ranked = [
+            {'category': category, 'score': entry['score'], 'confidence': self.confidence[category],
+             'keywords': sorted(entry['keywords'])}
+            for category, entry in scores.items()
+        ]
+        ranked.sort(key=lambda c: (-c['score'], self.priority[c['category']]))
+        return ranked
+
+def build_rules(taxonomy_rows):
+    """Merges taxonomy keywords into the built-in rules. New DocumentType terms go after the built-ins."""
+    rules = [(category, conf, dict(keywords)) for category, conf, keywords in DEFAULT_CATEGORY_KEYWORDS]
+    by_category = {category: keywords for category, _, keywords in rules}
+    for row in taxonomy_rows:
+        keywords = parse_keywords(row['keywords'])
+        if row['value'] in by_category:
+            by_category[row['value']].update(keywords)
+        elif keywords:
+            by_category[row['value']] = keywords
+            rules.append((row['value'], TAXONOMY_CONFIDENCE, keywords))
+    return rules
+
+_engine = {'engine': None, 'version': None, 'checked_at': 0.0}
+_engine_lock = threading.Lock()
+
+def get_classifier():
+    """
+    Returns the compiled classifier, rebuilding it when the taxonomy version
+    has changed. The version is checked at most every TAXONOMY_RECHECK_SECONDS.
+    """
+    now = time.time()
+    if _engine['engine'] is not None and now - _engine['checked_at'] < TAXONOMY_RECHECK_SECONDS:
+        return _engine['engine']
+
+    with _engine_lock:
+        if _engine['engine'] is not None and now - _engine['checked_at'] < TAXONOMY_RECHECK_SECONDS:
+            return _engine['engine']
+        try:
+            from database.db import get_taxonomy_version, get_classifier_keywords
+            version = get_taxonomy_version()
+            if _engine['engine'] is None or version != _engine['version']:
+                _engine['engine'] = ClassifierEngine(build_rules(get_classifier_keywords()))
+                _engine['version'] = version
+        except Exception as e:
+            # No database (scripts, first start): classify with the built-in rules
+            if _engine['engine'] is None:
+                print(f"Classifier using built-in keywords: {e}")
+                _engine['engine'] = ClassifierEngine(build_rules([]))
+        _engine['checked_at'] = now
+        return _engine['engine']
+
+def reload_classifier():
+    """Forces the next classification to re-check the taxonomy."""
+    _engine['checked_at'] = 0.0
+
+def rank_categories(text):
+    return get_classifier().rank(text)
 
 def classify_document(text):
     """
     Classifies document based on keywords in OCR text.
-    Returns: 'Invoice', 'Receipt', 'Contract', 'Report', or 'Unknown'
-    """
-    text = text.lower()
-    
-    if any(keyword in text for keyword in ['invoice', 'bill to', 'amount due', 'tax invoice']):
-        return 'Invoice', 0.95
-    
-    if any(keyword in text for keyword in ['receipt', 'transaction', 'payment', 'total']):
-        # Receipt / Invoice overlap, but 'receipt' keyword usually distinct for POS
-        return 'Receipt', 0.85
-        
-    if any(keyword in text for keyword in ['contract', 'agreement', 'undersigned', 'parties']):
-        return 'Contract', 0.90
-        
-    if any(keyword in text for keyword in ['report', 'summary', 'analysis', 'status']):
-        return 'Report', 0.80
-        
-    return 'Unknown', 0.0
+    Returns: (category, confidence) for the best scoring category, or ('Unknown', 0.0)
+    """
+    ranked = rank_categories(text)
+    if not ranked:
+        return 'Unknown', 0.0
+    return ranked[0]['category'], ranked[0]['confidence']
 
 def suggest_metadata_from_all(filename, text=None):
     """
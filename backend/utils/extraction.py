@@ -6,84 +6,181 @@ def extract_metadata(text, category):
     Extracts metadata from text based on the document category.
     Returns a dictionary of extracted fields.
     """
-    metadata = {}
-    
-    if category == "Invoice":
-        metadata = extract_invoice_metadata(text)
-    elif category == "Contract":
-        metadata = extract_contract_metadata(text)
-    elif category == "ID":
-        metadata = extract_id_metadata(text)
-    
-    return json.dumps(metadata)
+    return json.dumps(_field_values(text, category))
 
-def extract_invoice_metadata(text):
-    data = {}
-    
-    # 1. Invoice Number
-    # Pattern: /INV[- ]?\d+/ or /Invoice #:\s*(\d+)/
-    inv_match = re.search(r'(?:INV[- ]?\d+)|(?:Invoice\s*#[:\.]?\s*([\w-]+))', text, re.IGNORECASE)
-    if inv_match:
-        # Group 1 might be None if the first part of OR matched
-        data['invoice_number'] = inv_match.group(1) if inv_match.group(1) else inv_match.group(0)
-    else:
-        # Fallback generic
-        inv_match_generic = re.search(r'Invoice\s*(?:No|Number)?[:\.]?\s*([A-Z0-9-]+)', text, re.IGNORECASE)
-        if inv_match_generic:
-            data['invoice_number'] = inv_match_generic.group(1)
-
-    # 2. Date
-    # Pattern: /\d{2}[/-]\d{2}[/-]\d{4}/ (DD-MM-YYYY or MM-DD-YYYY or similar)
-    date_match = re.search(r'(\d{2}[/-]\d{2}[/-]\d{4})', text)
-    if date_match:
-        data['date'] = date_match.group(1)
-        
+class FieldSpec:
+    """
+    One way of finding one or more fields: a regex plus the group each field is
+    read from. A group may be a tuple, meaning the first group that matched.
+    Lower rank wins; higher ranks are fallbacks used only when no better spec
+    matched anywhere in the text.
+
+    `starts` lists (as regex class contents, case-insensitive) the characters a
+    match can begin with. Python's re does not optimize alternations, so this
+    lets the combined scan skip positions where no spec could start.
+    """
+
+    def __init__(self, pattern, fields, flags=re.IGNORECASE, rank=0, confidence=0.9, starts=None):
+        self.pattern = pattern
+        self.flags = flags
+        self.regex = re.compile(pattern, flags)
+        self.fields = fields
+        self.rank = rank
+        self.confidence = confidence
+        self.starts = starts
+
+    def values(self, match):
+        values = {}
+        for field, groups in self.fields.items():
+            for group in (groups if isinstance(groups, tuple) else (groups,)):
+                if match.group(group) is not None:
+                    values[field] = (match.group(group).strip(), match.span(group))
+                    break
+        return values
+
+def _non_capturing(pattern):
+    """
+    Turns the capturing groups of a pattern into (?:...) groups. Escapes
+    (\\( stays a literal paren) and character classes ([(] too) are copied as is.
+    """
+    out = []
+    i = 0
+    in_class = False
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            out.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if in_class:
+            if c == ']':
+                in_class = False
+        elif c == '[':
+            in_class = True
+            # A ']' right after '[' or '[^' is a literal member of the class
+            j = i + 1
+            if pattern[j:j + 1] == '^':
+                j += 1
+            if pattern[j:j + 1] == ']':
+                out.append(pattern[i:j + 1])
+                i = j + 1
+                continue
+        elif c == '(' and pattern[i + 1:i + 2] != '?':
+            out.append('(?:')
+            i += 1
+            continue
+        out.append(c)
+        i += 1
+    return ''.join(out)
+
+def _scoped(spec):
+    flags = ''
+    if spec.flags & re.IGNORECASE:
+        flags += 'i'
+    if spec.flags & re.MULTILINE:
+        flags += 'm'
+    # Numbered groups would clash in the combined pattern; only positions are used from it
+    body = _non_capturing(spec.pattern)
+    return f'(?{flags}:{body})' if flags else f'(?:{body})'
+
+class Extractor:
+    """
+    Runs every FieldSpec of a document type in one scan over the text.
+
+    The specs still being looked for are combined into a single regex. Each
+    position where it matches is checked against those specs, so every spec
+    gets its first match exactly as re.search would find it. Found specs drop
+    out of the combined regex, and the scan stops once every field is settled.
+    """
+
+    def __init__(self, specs):
+        self.specs = specs
+        self.field_order = list(dict.fromkeys(f for spec in specs for f in spec.fields))
+        self._combined = {}
+
+    def _combined_regex(self, remaining):
+        if remaining not in self._combined:
+            specs = [self.specs[i] for i in remaining]
+            pattern = '|'.join(_scoped(spec) for spec in specs)
+            if all(spec.starts for spec in specs):
+                pattern = '(?=(?i:[' + ''.join(spec.starts for spec in specs) + ']))(?:' + pattern + ')'
+            self._combined[remaining] = re.compile(pattern)
+        return self._combined[remaining]
+
+    def run(self, text):
+        """Returns {field: {'value', 'span', 'confidence'}}."""
+        results = {}
+        best_rank = {}
+        remaining = tuple(range(len(self.specs)))
+        pos = 0
+        while remaining and text:
+            hit = self._combined_regex(remaining).search(text, pos)
+            if not hit:
+                break
+            start = hit.start()
+            for i in remaining:
+                spec = self.specs[i]
+                match = spec.regex.match(text, start)
+                if not match:
+                    continue
+                for field, (value, span) in spec.values(match).items():
+                    if spec.rank < best_rank.get(field, float('inf')):
+                        best_rank[field] = spec.rank
+                        results[field] = {'value': value, 'span': span, 'confidence': spec.confidence}
+                remaining = tuple(j for j in remaining if j != i)
+
+            # Drop specs that can no longer improve any of their fields
+            remaining = tuple(
+                j for j in remaining
+                if any(self.specs[j].rank < best_rank.get(f, float('inf')) for f in self.specs[j].fields)
+            )
+            pos = start + 1
+        return {field: results[field] for field in self.field_order if field in results}
+
+EXTRACTORS = {}
+
+def register_extractor(category, specs):
+    EXTRACTORS[category] = Extractor(specs)
+
+def extract_fields(text, category):
+    """Field values with spans and confidence for a document type ({} if none registered)."""
+    extractor = EXTRACTORS.get(category)
+    return extractor.run(text or '') if extractor else {}
+
+def _field_values(text, category):
+    return {field: result['value'] for field, result in extract_fields(text, category).items()}
+
+register_extractor('Invoice', [
+    # 1. Invoice Number: /INV[- ]?\d+/ or /Invoice #:\s*(\d+)/, generic fallback
+    FieldSpec(r'(?:INV[- ]?\d+)|(?:Invoice\s*#[:\.]?\s*([\w-]+))', {'invoice_number': (1, 0)}, starts='i'),
+    FieldSpec(r'Invoice\s*(?:No|Number)?[:\.]?\s*([A-Z0-9-]+)', {'invoice_number': 1}, rank=1, confidence=0.6, starts='i'),
+    # 2. Date (DD-MM-YYYY or MM-DD-YYYY or similar)
+    FieldSpec(r'(\d{2}[/-]\d{2}[/-]\d{4})', {'date': 1}, flags=0, starts=r'\d'),
     # 3. Total Amount
-    amount_match = re.search(r'(?:Total|Amount|Balance|Due)[\s\:\$]*([\d,\.]+)', text, re.IGNORECASE)
-    if amount_match:
-        data['total_amount'] = amount_match.group(1)
-
-    # 4. Contextual Parsing for Companies
-    # "Bill To:" -> Addressed Company
-    bill_to_match = re.search(r'(?:Bill|Ship)\s*To[:\.]?\s*([^\n]+)', text, re.IGNORECASE)
-    if bill_to_match:
-        data['addressed_company'] = bill_to_match.group(1).strip()
-        
-    # "From:" -> Issuing Company
-    # Often the issuing company is at the very top or explicitly "From:"
-    from_match = re.search(r'(?:From|Vendor)[:\.]?\s*([^\n]+)', text, re.IGNORECASE)
-    if from_match:
-        data['issuing_company'] = from_match.group(1).strip()
-    else:
-        # Fallback: First non-empty line usually Issuing Company in headers
-        lines = [l.strip() for l in text.split('\n') if l.strip()]
-        if lines:
-            data['issuing_company'] = lines[0] # Naive assumption, but standard for headers
-            
-    return data
+    FieldSpec(r'(?:Total|Amount|Balance|Due)[\s\:\$]*([\d,\.]+)', {'total_amount': 1}, starts='tabd'),
+    # 4. Companies: "Bill To:" -> addressed, "From:" -> issuing
+    FieldSpec(r'(?:Bill|Ship)\s*To[:\.]?\s*([^\n]+)', {'addressed_company': 1}, starts='bs'),
+    FieldSpec(r'(?:From|Vendor)[:\.]?\s*([^\n]+)', {'issuing_company': 1}, starts='fv'),
+    # Fallback: First non-empty line usually Issuing Company in headers
+    FieldSpec(r'^[^\S\n]*(\S[^\n]*)', {'issuing_company': 1}, flags=re.MULTILINE, rank=1, confidence=0.4),
+])
 
-def extract_contract_metadata(text):
-    data = {}
-    
-    # Date
-    date_match = re.search(r'(?:Date|Effective)[\s\:]*(\d{1,4}[-/\.]\d{1,2}[-/\.]\d{1,4})', text, re.IGNORECASE)
-    if date_match:
-        data['contract_date'] = date_match.group(1)
-        
+register_extractor('Contract', [
+    FieldSpec(r'(?:Date|Effective)[\s\:]*(\d{1,4}[-/\.]\d{1,2}[-/\.]\d{1,4})', {'contract_date': 1}, starts='de'),
     # Parties (looking for "Between X and Y")
-    parties_match = re.search(r'Between\s+(.*?)\s+and\s+(.*?)[\.,\n]', text, re.IGNORECASE)
-    if parties_match:
-        data['party_1'] = parties_match.group(1).strip()
-        data['party_2'] = parties_match.group(2).strip()
-        
-    return data
+    FieldSpec(r'Between\s+(.*?)\s+and\s+(.*?)[\.,\n]', {'party_1': 1, 'party_2': 2}, confidence=0.7, starts='b'),
+])
+
+register_extractor('ID', [
+    # ID Number (Generic 6+ characters)
+    FieldSpec(r'(?:ID|No|Number)[\s\.\:]*([A-Z0-9-]{6,})', {'id_number': 1}, starts='in'),
+])
+
+def extract_invoice_metadata(text):
+    return _field_values(text, 'Invoice')
+
+def extract_contract_metadata(text):
+    return _field_values(text, 'Contract')
 
 def extract_id_metadata(text):
-    data = {}
-    
-    # ID Number (Generic 8+ digits)
-    id_match = re.search(r'(?:ID|No|Number)[\s\.\:]*([A-Z0-9-]{6,})', text, re.IGNORECASE)
-    if id_match:
-        data['id_number'] = id_match.group(1)
-        
-    return data
+    return _field_values(text, 'ID')
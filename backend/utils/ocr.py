@@ -1,15 +1,185 @@
 import pytesseract
-from PIL import Image, ImageStat
 import os
+import queue
+import random
+import threading
+import hashlib
+import json
+import logging
+from utils.preprocessing import preprocess_image, MAX_OCR_EDGE_PX
 
 # NOTE: If Tesseract is not in your PATH, uncomment and set the path below:
 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
 
+try:
+    import fitz  # PyMuPDF
+except ImportError:
+    fitz = None
+
 try:
     import PyPDF2
 except ImportError:
     PyPDF2 = None
 
+try:
+    import tesserocr  # In-process Tesseract C-API bindings
+except ImportError:
+    tesserocr = None
+
+OCR_LANG = os.environ.get('KBN_OCR_LANG', 'eng')
+OCR_PSM = 3  # Auto page segmentation (tesserocr.PSM.AUTO)
+
+logger = logging.getLogger(__name__)
+
+
+class TesserocrEngine:
+    """
+    Long-lived Tesseract instance loaded once per worker thread. Images are
+    handed over in memory, so there is no process fork, model load or temp file
+    per page.
+    """
+    name = 'tesserocr'
+
+    def __init__(self, lang=OCR_LANG):
+        # tesserocr.PSM members are plain ints
+        self.api = tesserocr.PyTessBaseAPI(lang=lang, psm=OCR_PSM)
+
+    def image_to_data(self, img):
+        self.api.SetImage(img)
+        self.api.Recognize()
+        data = {'text': [], 'conf': [], 'left': [], 'top': [], 'width': [], 'height': []}
+        level = tesserocr.RIL.WORD
+        for word in tesserocr.iterate_level(self.api.GetIterator(), level):
+            box = word.BoundingBox(level)
+            if box is None:
+                continue
+            data['text'].append(word.GetUTF8Text(level) or "")
+            data['conf'].append(word.Confidence(level))
+            data['left'].append(box[0])
+            data['top'].append(box[1])
+            data['width'].append(box[2] - box[0])
+            data['height'].append(box[3] - box[1])
+        self.api.Clear()
+        return data
+
+
+class PytesseractEngine:
+    """Fallback: one tesseract subprocess per image via pytesseract."""
+    name = 'pytesseract'
+
+    def __init__(self, lang=OCR_LANG):
+        self.config = f'--psm {OCR_PSM}'
+        self.lang = lang
+
+    def image_to_data(self, img):
+        return pytesseract.image_to_data(img, lang=self.lang, config=self.config,
+                                         output_type=pytesseract.Output.DICT)
+
+
+# Debug capture of OCR input images (off unless KBN_OCR_DEBUG_DIR is set)
+OCR_DEBUG_DIR = os.environ.get('KBN_OCR_DEBUG_DIR')
+OCR_DEBUG_SAMPLE_RATE = float(os.environ.get('KBN_OCR_DEBUG_SAMPLE_RATE', '1.0'))
+
+_debug_queue = queue.Queue(maxsize=32)
+_debug_writer = None
+_debug_lock = threading.Lock()
+
+def _debug_writer_loop():
+    while True:
+        img, path = _debug_queue.get()
+        try:
+            img.save(path)
+        except Exception as e:
+            print(f"OCR debug capture failed for {path}: {e}")
+
+def capture_debug_image(img, image_path):
+    """
+    Queues a copy of the OCR input for a background thread to write to
+    OCR_DEBUG_DIR/<page file>.png. Sampled by OCR_DEBUG_SAMPLE_RATE; captures
+    are dropped rather than slowing OCR when the writer falls behind.
+    """
+    global _debug_writer
+    if not OCR_DEBUG_DIR or random.random() >= OCR_DEBUG_SAMPLE_RATE:
+        return
+    with _debug_lock:
+        if _debug_writer is None:
+            os.makedirs(OCR_DEBUG_DIR, exist_ok=True)
+            _debug_writer = threading.Thread(target=_debug_writer_loop, name="ocr-debug-writer")
+            _debug_writer.daemon = True
+            _debug_writer.start()
+    name = os.path.splitext(os.path.basename(image_path))[0] + '.png'
+    try:
+        _debug_queue.put_nowait((img.copy(), os.path.join(OCR_DEBUG_DIR, name)))
+    except queue.Full:
+        pass
+
+
+# OCR result cache. Bump OCR_CONFIG_VERSION whenever preprocessing or engine
+# settings change in a way that alters output, so stale results are not reused.
+OCR_CACHE_ENABLED = os.environ.get('KBN_OCR_CACHE', '1') != '0'
+OCR_CACHE_MAX_BYTES = int(os.environ.get('KBN_OCR_CACHE_MAX_MB', 256)) * 1024 * 1024
+OCR_CACHE_EVICT_EVERY = 100  # puts between eviction passes
+OCR_CONFIG_VERSION = f"1:{OCR_LANG}:psm{OCR_PSM}:edge{MAX_OCR_EDGE_PX}"
+
+_cache_puts = 0
+_cache_lock = threading.Lock()
+
+def hash_page_file(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def _load_cached_result(page_hash, engine_name):
+    from database.db import get_cached_ocr
+    try:
+        cached = get_cached_ocr(page_hash, engine_name, OCR_CONFIG_VERSION)
+    except Exception as e:
+        print(f"OCR cache lookup failed: {e}")
+        return None
+    if cached:
+        return cached['text'], cached['confidence'], cached['confidence_reason']
+    return None
+
+def _store_cached_result(page_hash, engine_name, result, data):
+    global _cache_puts
+    from database.db import put_cached_ocr, evict_ocr_cache
+    words = [
+        [data['text'][i], data['conf'][i], data['left'][i], data['top'][i], data['width'][i], data['height'][i]]
+        for i in range(len(data['text'])) if str(data['text'][i]).strip()
+    ]
+    try:
+        put_cached_ocr(page_hash, engine_name, OCR_CONFIG_VERSION, result[0], result[1], result[2], json.dumps(words))
+        with _cache_lock:
+            _cache_puts += 1
+            evict = _cache_puts % OCR_CACHE_EVICT_EVERY == 0
+        if evict:
+            evict_ocr_cache(OCR_CACHE_MAX_BYTES)
+    except Exception as e:
+        print(f"OCR cache store failed: {e}")
+
+
+_engine_local = threading.local()
+
+def get_ocr_engine():
+    """
+    Returns this thread's OCR engine, creating it on first use. Processing
+    workers are persistent threads, so each keeps its engine (and loaded
+    language model) for its whole lifetime.
+    """
+    engine = getattr(_engine_local, 'engine', None)
+    if engine is None:
+        if tesserocr:
+            try:
+                engine = TesserocrEngine()
+            except Exception as e:
+                logger.warning("tesserocr engine could not start (%s: %s), falling back to pytesseract", type(e).__name__, e)
+        if engine is None:
+            engine = PytesseractEngine()
+        _engine_local.engine = engine
+    return engine
+
 def extract_text(image_path):
     """
     Extracts text and average confidence score from an image file using OCR.
@@ -18,6 +188,18 @@ def extract_text(image_path):
     try:
         # 1. Handle PDFs First
         if image_path.lower().endswith('.pdf'):
+            if fitz:
+                # PyMuPDF text layer extraction (born-digital pages from split_pdf land here)
+                try:
+                    with fitz.open(image_path) as pdf:
+                        text = " ".join(page.get_text("text") for page in pdf)
+                    if text.strip():
+                        return text.strip(), 100.0, "Digital PDF (Perfect)"
+                    return "", 0.0, "Scanned PDF - OCR requires hosting update"
+                except Exception as e:
+                    print(f"PDF Error: {e}")
+                    return "", 0.0, f"PDF Process Failed: {str(e)}"
+
             if not PyPDF2:
                 # Fallback or Error if lib missing
                 return "", 0.0, "OCR Error: PyPDF2 library not installed on server"
@@ -39,17 +221,22 @@ def extract_text(image_path):
                  return "", 0.0, f"PDF Process Failed: {str(e)}"
 
         # 2. Handle Images
-        # Open the image file
-        img = Image.open(image_path)
+        engine = get_ocr_engine()
+        page_hash = hash_page_file(image_path) if OCR_CACHE_ENABLED else None
+        if page_hash:
+            cached = _load_cached_result(page_hash, engine.name)
+            if cached:
+                return cached
+
+        # Decode once: grayscale, deskewed, binarized, size-capped
+        prepared = preprocess_image(image_path)
+        img = prepared['image']
         
-        # Save debug image
-        img.save("debug_ocr.png")
+        capture_debug_image(img, image_path)
 
         # Perform OCR with data (for confidence)
         # Using PSM 3 (Auto) as requested
-        data = pytesseract.image_to_data(img, output_type=pytesseract.Output.DICT, config='--psm 3')
-        
-        # Calculate average confidence
+        data = engine.image_to_data(img)
         
         # Calculate average confidence
         # 'conf' is a list of confidence scores (-1 for no text)
@@ -76,7 +263,10 @@ def extract_text(image_path):
         # Basic Quality Check
         if not text.strip():
             # Bug 3 Fix: Explicitly flag 0-conf inputs as valid but requiring review
-            return "", 0.0, "Requires Review (No Text)"
+            result = ("", 0.0, "Requires Review (No Text)")
+            if page_hash:
+                _store_cached_result(page_hash, engine.name, result, data)
+            return result
             
         reason = None
         # FR-32: Confidence Reason Logic
@@ -85,7 +275,7 @@ def extract_text(image_path):
             if final_conf == 0:
                  reason = "Requires Review (Confidence 0%)"
             # 1. Low Resolution Check
-            elif img.width < 1500:
+            elif prepared['width'] < 1500:
                 reason = 'Low Resolution'
             else:
                 # 2. Noise/Garbage Check (Ratio of special chars)
@@ -98,8 +288,7 @@ def extract_text(image_path):
                     # 3. Poor Contrast Check
                     # Simple heuristic: Standard Deviation of pixel intensity
                     # Low std dev means flat/grey image.
-                    stat = ImageStat.Stat(img.convert('L'))
-                    std_dev = stat.stddev[0]
+                    std_dev = prepared['contrast']
                     # Threshold logic: < 30 is usually very low contrast
                     if std_dev < 30:
                         reason = 'Poor Contrast'
@@ -107,6 +296,8 @@ def extract_text(image_path):
                         # 4. Default
                         reason = 'Complex Layout/Handwriting'
             
+        if page_hash:
+            _store_cached_result(page_hash, engine.name, (text, final_conf, reason), data)
         return text, final_conf, reason
 
     except pytesseract.TesseractNotFoundError:
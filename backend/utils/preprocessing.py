@@ -0,0 +1,95 @@
+import os
+from PIL import Image, ImageStat
+
+# Tesseract gains nothing above ~300 DPI on a letter page; bigger scans only cost time
+MAX_OCR_EDGE_PX = int(os.environ.get('KBN_OCR_MAX_EDGE_PX', 3500))
+
+# Deskew search: small angles only, on a reduced copy of the page
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+DESKEW_MIN_ANGLE = 0.3   # Below this, rotating costs more than it helps
+DESKEW_PROBE_EDGE_PX = 800
+
+def otsu_threshold(gray):
+    """Otsu's threshold from the histogram of an 'L' image."""
+    hist = gray.histogram()[:256]
+    total = sum(hist)
+    sum_all = sum(i * h for i, h in enumerate(hist))
+    sum_bg = 0
+    weight_bg = 0
+    best_t, best_var = 127, -1.0
+    for t in range(256):
+        weight_bg += hist[t]
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += t * hist[t]
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        var = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if var > best_var:
+            best_t, best_var = t, var
+    return best_t
+
+def estimate_skew(gray):
+    """
+    Finds the small rotation that makes text lines horizontal, by maximizing the
+    variance of the row projection profile (text rows vs. gaps between them).
+    Returns the correction angle in degrees.
+    """
+    probe = gray.copy()
+    probe.thumbnail((DESKEW_PROBE_EDGE_PX, DESKEW_PROBE_EDGE_PX))
+    threshold = otsu_threshold(probe)
+    # Ink = 255 so rotation padding (0) does not count as text
+    ink = probe.point(lambda p: 255 if p < threshold else 0)
+
+    best_angle, best_score = 0.0, -1.0
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    for i in range(-steps, steps + 1):
+        angle = i * DESKEW_STEP
+        rotated = ink.rotate(angle, resample=Image.NEAREST) if angle else ink
+        # Squeezing to one column averages each row: the projection profile
+        profile = rotated.resize((1, rotated.height), Image.BOX)
+        score = ImageStat.Stat(profile).var[0]
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+def preprocess_image(image_path):
+    """
+    Decodes an image once and prepares it for OCR: grayscale, downscale
+    oversized scans, deskew and binarize. Diagnostics used for the confidence
+    reason are computed from the same grayscale buffer.
+
+    Returns a dict with the OCR-ready 'image' and the source 'width'/'height',
+    'contrast' (pixel std dev) and 'skew_angle'.
+    """
+    with Image.open(image_path) as src:
+        width, height = src.size
+        if src.format == 'JPEG':
+            # Let libjpeg decode straight to grayscale
+            src.draft('L', src.size)
+        gray = src.convert('L')
+
+    scale = MAX_OCR_EDGE_PX / max(width, height)
+    if scale < 1:
+        gray = gray.resize((max(1, int(width * scale)), max(1, int(height * scale))), Image.LANCZOS)
+
+    contrast = ImageStat.Stat(gray).stddev[0]
+
+    angle = estimate_skew(gray)
+    if abs(angle) >= DESKEW_MIN_ANGLE:
+        gray = gray.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+    threshold = otsu_threshold(gray)
+    binary = gray.point(lambda p: 255 if p > threshold else 0)
+
+    return {
+        'image': binary,
+        'width': width,
+        'height': height,
+        'contrast': contrast,
+        'skew_angle': angle
+    }
@@ -0,0 +1,303 @@
+import os
+import json
+import sqlite3
+from utils.ocr import extract_text
+from utils.classification import classify_document, suggest_metadata_from_all, get_risk_level
+from database.db import (
+    get_db_connection, get_document, audit_statement, check_approval_required, document_text_statement
+)
+from database.write_batcher import get_write_batcher
+
+# Same default as app.py (uploads/ under the working directory)
+DEFAULT_UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.gif')
+
+def get_processing_queue(filepath):
+    """
+    Images need Tesseract ('ocr' queue); everything else (digital PDFs, text) is cheap ('text' queue).
+    """
+    return 'ocr' if filepath.lower().endswith(IMAGE_EXTENSIONS) else 'text'
+
+def resolve_job_path(doc_id, filepath, upload_folder=None):
+    """
+    A retried job may find its page already renamed/moved by the previous
+    attempt; fall back to the path currently recorded on the document.
+    """
+    if os.path.exists(filepath):
+        return filepath
+    doc = get_document(doc_id)
+    if doc and doc.get('filename'):
+        candidate = os.path.join(upload_folder or DEFAULT_UPLOAD_FOLDER, doc['filename'])
+        if os.path.exists(candidate):
+            return candidate
+    return filepath
+
+def run_processing_job(doc_id, filepath, upload_folder=None):
+    """
+    Job handler for the processing queues. Returns the Future of the page's
+    database writes so the worker can commit the job completion after them.
+    """
+    get_write_batcher().submit([("UPDATE documents SET ocr_status = 'Processing' WHERE id = ?", (doc_id,))])
+    filepath = resolve_job_path(doc_id, filepath, upload_folder)
+    if not os.path.exists(filepath):
+        # Raising lets the job queue retry / dead-letter the page
+        raise FileNotFoundError(f"Page file missing: {filepath}")
+    return process_document_background(doc_id, filepath, upload_folder, wait=False)
+
+def process_document_background(doc_id, filepath, upload_folder=None, wait=True):
+    """
+    Background worker to run OCR and Classification, then update DB.
+
+    The final state of the document is worked out in memory and written as one
+    unit through the write batcher. With wait=False the Future of that write is
+    returned instead of waiting for the commit.
+    """
+    writes = []
+    moved = None
+    try:
+        # Fetch existing doc to check for overrides (manual category/metadata)
+        from database.db import get_document
+        existing_doc = get_document(doc_id)
+        manual_category = None
+        manual_metadata = {}
+        if existing_doc:
+            if existing_doc['category'] and existing_doc['category'] != 'Unclassified':
+                manual_category = existing_doc['category']
+            if existing_doc['metadata']:
+                try:
+                    manual_metadata = json.loads(existing_doc['metadata'])
+                except:
+                    pass
+
+        # 1. OCR
+        text, confidence, confidence_reason = extract_text(filepath)
+        
+        # Validation & Fallback
+        if not text or len(text.strip()) < 10 or text == "OCR_SKIPPED":
+             # Fallback: Try to classify by filename
+            # from utils.classification import suggest_metadata_from_all # REMOVED: Use global
+            suggestions = suggest_metadata_from_all(os.path.basename(filepath))
+            
+            fallback_category = suggestions.get('category')
+            
+            # IMPROVEMENT: If manual category exists, we don't fail, we just succeed with no OCR content
+            if manual_category:
+                # Success via Manual Override
+                category = manual_category
+                # Metadata
+                meta_json = json.dumps(manual_metadata) if manual_metadata else "{}"
+                
+                writes += status_statements(doc_id, "Completed (No OCR)", "Content parsing skipped (OCR missing).", 1.0, category, meta_json, category + " Template")
+                return _submit_writes(writes, wait)
+
+            if fallback_category:
+                # Success via Fallback
+                category = fallback_category
+                
+                # We save with a specific status indicating no OCR was done
+                ocr_status_label = "Completed (No OCR)"
+                
+                # Construct metadata from suggestions
+                meta_json = json.dumps(suggestions)
+                
+                writes += status_statements(doc_id, ocr_status_label, "Content parsing skipped (OCR missing).", 0.5, category, meta_json, category + " Template")
+                writes.append(audit_statement('document', doc_id, 'classification_fallback', f"Classified as {category} using filename fallback", "System"))
+                return _submit_writes(writes, wait)
+            else:
+                # Failed and no fallback found
+                target_cat = "Unclassified"
+                writes += status_statements(doc_id, "Failed", "No text detected and filename insufficient.", 0.0, target_cat)
+                return _submit_writes(writes, wait)
+
+        # 2. Classification
+        classified_cat, classified_conf = classify_document(text)
+        
+        # IMPROVEMENT: Priority Logic
+        if manual_category:
+            category = manual_category
+            final_confidence = 1.0 # High confidence because user said so
+        else:
+            category = classified_cat
+            # Map "High"/"Medium"/"Low" to float?
+            # heuristic: High=0.9, Medium=0.7, Low=0.4? 
+            # Or just use the OCR confidence? 
+            # Existing code used 'confidence' (from OCR)
+            # Let's use OCR confidence but boosted if Classification matches something?
+            # For now, stick to OCR confidence unless it's very low?
+            final_confidence = confidence
+
+        # 3. Extraction
+        from utils.extraction import extract_metadata
+        extracted_metadata = extract_metadata(text, category)
+        
+        # Merge Metadata (Manual overrides extracted)
+        # Ensure extracted_metadata is dict
+        if isinstance(extracted_metadata, str):
+            try:
+                extracted_metadata = json.loads(extracted_metadata)
+            except:
+                extracted_metadata = {}
+        
+        if not isinstance(extracted_metadata, dict):
+            extracted_metadata = {}
+            
+        # Merge: Start with extracted, update with manual
+        final_metadata = extracted_metadata.copy()
+        final_metadata.update(manual_metadata)
+        metadata_json = json.dumps(final_metadata)
+
+        # 4. Auto-Renaming & Routing (Moved After Extraction)
+        from utils.renaming import plan_processed_move, rename_statements, discard_stale_placeholder
+        # Pass final_metadata for intelligent naming. The file is only moved
+        # once the rename is committed (see _submit_writes), so a retry after a
+        # failed batch still finds it where documents.filename says.
+        if existing_doc:
+            discard_stale_placeholder(existing_doc['filename'], filepath, upload_folder or DEFAULT_UPLOAD_FOLDER)
+        moved = plan_processed_move(doc_id, filepath, category, upload_folder or DEFAULT_UPLOAD_FOLDER, final_metadata)
+        if moved:
+            writes += rename_statements(doc_id, category, moved)
+            moved['previous_filename'] = existing_doc['filename'] if existing_doc else None
+            filepath = moved['new_path']
+
+        # 5. Suggestions (Refined)
+        final_suggestions = suggest_metadata_from_all(os.path.basename(filepath), text)
+        
+        # 6. Legacy Auto-Routing Logic (FR-24) - Keeps container routing
+        routing_keywords = {
+            'HR': 'DEPT-HR',
+            'HUMAN RESOURCES': 'DEPT-HR',
+            'FINANCE': 'DEPT-FINANCE',
+            'PAYROLL': 'DEPT-FINANCE',
+            'LEGAL': 'DEPT-LEGAL',
+            'CONTRACT': 'DEPT-LEGAL',
+            'OPERATIONS': 'DEPT-OPERATIONS',
+            'SALES': 'DEPT-SALES',
+            'UAE': 'DEPT-UAE',
+            'DUBAI': 'DEPT-UAE',
+            'KBN UAE': 'DEPT-UAE'
+        }
+        
+        found_container = None
+        upper_text = text.upper()
+        for kw, cid in routing_keywords.items():
+            if kw in upper_text:
+                found_container = cid
+                break
+        
+        container_id = existing_doc['container_id'] if existing_doc else None
+        conn = get_db_connection()
+        if found_container:
+            # Check if container exists before routing
+            exists = conn.execute("SELECT 1 FROM containers WHERE id = ?", (found_container,)).fetchone()
+            if exists:
+                container_id = found_container
+                writes.append(("UPDATE documents SET container_id = ? WHERE id = ?", (found_container, doc_id)))
+                writes.append(audit_statement('document', doc_id, 'auto_route', f"Automatically routed to {found_container} base on keywords", "System"))
+
+        # 7. Confidence-Based Automation and Approval Logic
+        risk = get_risk_level(category)
+        
+        # Determine initial approval status
+        container_row = conn.execute('SELECT confidentiality_level FROM containers WHERE id = ?', (container_id,)).fetchone()
+        confidentiality = container_row['confidentiality_level'] if container_row else 'Internal'
+        conn.close()
+        
+        needs_approval = check_approval_required(category, confidentiality)
+        
+        if needs_approval:
+            writes += status_statements(doc_id, "Completed", text, final_confidence, category, metadata_json, category + " Template")
+            writes.append(("UPDATE documents SET approval_status = ? WHERE id = ?", ("Pending Approval", doc_id)))
+            writes.append(audit_statement('document', doc_id, 'approval_action', "Approval status changed to Pending Approval.", "System"))
+        
+        # FR-32: Fast-Track QC Logic
+        elif final_confidence > 90 and risk == "Low":
+            # High confidence + Low Risk -> QC Passed automatically
+            writes += status_statements(doc_id, "QC_Passed", text, final_confidence, category, metadata_json, category + " Template", confidence_reason)
+            writes.append(audit_statement('document', doc_id, 'auto-qc', f"Auto-passed QC (Conf: {final_confidence}%)", "System"))
+        else:
+            # Rigorous QC Required
+            # Mark as 'Rigorous_QC' to be explicit in the UI badges.
+            writes += status_statements(doc_id, "Rigorous_QC", text, final_confidence, category, metadata_json, category + " Template", confidence_reason)
+
+        return _submit_writes(writes, wait, doc_id, moved)
+        
+    except sqlite3.OperationalError:
+        # Transient (e.g. database is locked): let the job queue retry the page
+        _discard_unsubmitted_move(moved)
+        raise
+    except Exception as e:
+        _discard_unsubmitted_move(moved)
+        print(f"Background Job Failed for Doc {doc_id}: {e}")
+        # update_document_status will need to handle strict args, maybe pass Nones
+        update_document_status(doc_id, "Failed", f"Error: {str(e)}", 0.0, "Unclassified", "{}", None)
+
+def status_statements(doc_id, status, content, confidence, category, metadata=None, template_type=None, confidence_reason=None):
+    """The writes behind update_document_status, as (sql, params) statements."""
+    from database.db import validate_metadata
+    statements = []
+    
+    # FR-15: Validation
+    if metadata:
+        try:
+            m_dict = json.loads(metadata) if isinstance(metadata, str) else metadata
+            is_valid, error = validate_metadata(category, m_dict)
+            if not is_valid:
+                statements.append(audit_statement('Document', doc_id, 'Validation Error', error, 'System'))
+                # For now, we still save but mark status or log error. 
+                # Request says "implement field-level validation", usually implying logging or blocking.
+        except:
+            pass
+
+    statements.append(('''
+        UPDATE documents 
+        SET ocr_status = ?, confidence = ?, category = ?, metadata = ?, template_type = ?, confidence_reason = ?
+        WHERE id = ?
+    ''', (status, confidence, category, metadata, template_type, confidence_reason, doc_id)))
+    statements.append(document_text_statement(doc_id, content))
+    return statements
+
+def update_document_status(doc_id, status, content, confidence, category, metadata=None, template_type=None, confidence_reason=None):
+    try:
+        get_write_batcher().write(status_statements(doc_id, status, content, confidence, category, metadata, template_type, confidence_reason))
+    except sqlite3.OperationalError:
+        # Still locked after busy_timeout: surface it so the job is retried
+        # instead of losing the status update
+        raise
+    except Exception as e:
+        print(f"Failed to update DB for doc {doc_id}: {e}")
+
+def _finish_move(doc_id, moved, future):
+    """Moves the page into processed/ once its rename committed."""
+    from utils.renaming import finish_processed_move, discard_processed_move
+    if future.exception() is not None:
+        # Rolled back: the retry works on the file where it is
+        discard_processed_move(moved)
+        return
+    if finish_processed_move(moved):
+        print(f"Auto-Renamed and Moved to: {moved['new_path']}")
+        return
+    # Point the document back at the file
+    get_write_batcher().write([
+        ("UPDATE documents SET filename = ? WHERE id = ?", (moved['previous_filename'], doc_id)),
+        audit_statement('document', doc_id, 'AUTO_ORGANIZE', f"Move to {moved['relative_filename']} failed; file left in place", "System")
+    ])
+
+def _discard_unsubmitted_move(moved):
+    # Once submitted, _finish_move owns the reservation
+    if moved and not moved.get('submitted'):
+        from utils.renaming import discard_processed_move
+        discard_processed_move(moved)
+
+def _submit_writes(writes, wait, doc_id=None, moved=None):
+    future = get_write_batcher().submit(writes)
+    if moved:
+        moved['submitted'] = True
+        # Move on this (worker) thread after the rename commits and before the
+        # job is completed: if the process dies in between, the job is leased
+        # again and the retry finds the file where it was
+        future.exception()
+        _finish_move(doc_id, moved, future)
+    if not wait:
+        return future
+    return future.result()
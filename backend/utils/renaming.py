@@ -1,14 +1,14 @@
 import os
-import shutil
 import uuid
 from datetime import datetime
-from database.db import get_db_connection, log_audit
+from database.db import get_db_connection, log_audit, audit_statement
 
-def process_rename_and_move(doc_id, current_path, doc_type, base_folder, metadata=None):
+def plan_processed_move(doc_id, current_path, doc_type, base_folder, metadata=None):
     """
-    Renames the file to [CompanyAddressedTo]_[InvoiceNumber]_[Date]_[IssuingCompany].ext 
-    and moves it to processed/[IssuingCompany]/[Date]/ folder.
-    Updates the database with the new path and filename.
+    Works out the new name [CompanyAddressedTo]_[InvoiceNumber]_[Date]_[IssuingCompany].ext
+    under processed/[IssuingCompany]/[Date]/ and reserves it with an empty
+    placeholder file; the file itself is not moved (see finish_processed_move).
+    Returns a dict describing the move, or False.
     """
     try:
         if not os.path.exists(current_path):
@@ -61,34 +61,98 @@ def process_rename_and_move(doc_id, current_path, doc_type, base_folder, metadat
         
         new_path = os.path.join(processed_dir, new_filename)
         
-        # 2. Move File
-        # Handle collision
-        if os.path.exists(new_path):
-            base, extension = os.path.splitext(new_filename)
-            new_filename = f"{base}_{uuid.uuid4().hex[:4]}{extension}"
-            new_path = os.path.join(processed_dir, new_filename)
-
-        shutil.move(current_path, new_path)
-        print(f"Renamed/Moved to {new_path}")
+        # 2. Reserve the name; concurrent pages with the same metadata get a suffix
+        while True:
+            try:
+                open(new_path, 'x').close()
+                break
+            except FileExistsError:
+                base, extension = os.path.splitext(f"{company_to}_{invoice_num}_{doc_date}_{issuing_company}{ext}")
+                new_filename = f"{base}_{uuid.uuid4().hex[:4]}{extension}"
+                new_path = os.path.join(processed_dir, new_filename)
         
-        # 3. Update Database
         # Relative path for DB (using forward slashes)
         relative_filename = f"processed/{issuing_company}/{today_str}/{new_filename}"
+        return {
+            'current_path': current_path,
+            'new_path': new_path,
+            'new_filename': new_filename,
+            'relative_filename': relative_filename,
+            'details': f"Renamed to {new_filename} and moved to {issuing_company}/{today_str}"
+        }
         
+    except Exception as e:
+        print(f"Error in renaming/moving: {e}")
+        return False
+
+def finish_processed_move(moved):
+    """Moves the file onto its reserved name. Returns True on success."""
+    try:
+        os.replace(moved['current_path'], moved['new_path'])
+        print(f"Renamed/Moved to {moved['new_path']}")
+        return True
+    except OSError as e:
+        print(f"Error in renaming/moving: {e}")
+        discard_processed_move(moved)
+        return False
+
+def discard_processed_move(moved):
+    """Drops the placeholder of a move that will not happen."""
+    try:
+        os.remove(moved['new_path'])
+    except OSError:
+        pass
+
+def discard_stale_placeholder(filename, current_path, base_folder):
+    """
+    Removes the empty placeholder a previous attempt reserved under processed/
+    and recorded in documents.filename, if the file never got there (the
+    process stopped between the commit and the move).
+    """
+    if not filename or not filename.startswith('processed/'):
+        return
+    path = os.path.join(base_folder, *filename.split('/'))
+    try:
+        if os.path.abspath(path) != os.path.abspath(current_path) and os.path.getsize(path) == 0:
+            os.remove(path)
+    except OSError:
+        pass
+
+def move_to_processed(doc_id, current_path, doc_type, base_folder, metadata=None):
+    """
+    Renames and moves the file into processed/ (see plan_processed_move).
+    Does not touch the database. Returns a dict describing the move, or False.
+    """
+    moved = plan_processed_move(doc_id, current_path, doc_type, base_folder, metadata)
+    if moved and not finish_processed_move(moved):
+        return False
+    return moved
+
+def rename_statements(doc_id, doc_type, moved):
+    """Database writes for a completed move, as (sql, params) statements."""
+    return [
+        ("UPDATE documents SET filename = ?, category = ? WHERE id = ?", (moved['relative_filename'], doc_type, doc_id)),
+        audit_statement('document', doc_id, 'AUTO_ORGANIZE', moved['details'], "System")
+    ]
+
+def process_rename_and_move(doc_id, current_path, doc_type, base_folder, metadata=None):
+    """
+    Moves the file into processed/ (see move_to_processed) and updates the
+    database with the new path and filename.
+    """
+    moved = move_to_processed(doc_id, current_path, doc_type, base_folder, metadata)
+    if not moved:
+        return False
+    try:
         conn = get_db_connection()
         conn.execute("UPDATE documents SET filename = ?, category = ? WHERE id = ?", 
-                     (relative_filename, doc_type, doc_id))
+                     (moved['relative_filename'], doc_type, doc_id))
         conn.commit()
         conn.close()
         
-        # 4. Log Audit
-        log_audit('document', doc_id, 'AUTO_ORGANIZE', f"Renamed to {new_filename} and moved to {issuing_company}/{today_str}", "System")
-        
-        return new_path
+        log_audit('document', doc_id, 'AUTO_ORGANIZE', moved['details'], "System")
         
-    except Exception as e:
-        print(f"Error in renaming/moving: {e}")
-        return False
+        return moved['new_path']
         
     except Exception as e:
         print(f"Error in renaming/moving: {e}")
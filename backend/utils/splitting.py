@@ -1,34 +1,194 @@
 ﻿import fitz  # PyMuPDF
 import os
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
-def split_pdf(file_path, output_dir):
+# Page rendering runs in separate processes (PyMuPDF holds the GIL), each with
+# its own fitz document handle. Small PDFs are rendered inline, on a handle
+# opened for that call.
+RENDER_WORKERS = int(os.environ.get('KBN_RENDER_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# spawn everywhere (the Windows default): no fork of the multi-threaded server.
+# Workers import only this module's dependencies, plus the main module as
+# __mp_main__ (app.py skips its startup work in that case).
+RENDER_START_METHOD = os.environ.get('KBN_RENDER_START_METHOD', 'spawn')
+MIN_PARALLEL_PAGES = 4
+
+# DPI bounds for OCR rendering
+TEXT_LAYER_DPI = 150      # Vector text renders crisp at low resolution
+SCAN_MIN_DPI = 150
+SCAN_MAX_DPI = 300        # Tesseract gains nothing above ~300 DPI
+SMALL_PAGE_DPI = 300      # Receipts, IDs, cheques: small glyphs need more pixels
+SMALL_PAGE_MAX_EDGE_PT = 7 * 72
+MAX_RENDER_EDGE_PX = 4200 # Caps oversized (A2/A3, engineering) sheets
+
+# A text layer is trusted (page skips OCR) when it has enough characters and
+# is mostly alphanumeric; broken font encodings produce symbol soup instead.
+MIN_TEXT_LAYER_CHARS = 50
+MIN_TEXT_LAYER_ALNUM_RATIO = 0.6
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+# Set only inside render processes (see _init_render_worker): the PDF the
+# worker last rendered from, kept open across its tasks.
+_worker_doc = None
+
+def choose_render_dpi(page, has_text_layer=None):
+    """
+    Picks the render DPI for one page from its size, its text layer and the
+    resolution of the scan embedded in it.
+    """
+    if has_text_layer is None:
+        has_text_layer = bool(page.get_text("text").strip())
+
+    long_edge_pt = max(page.rect.width, page.rect.height) or 792
+
+    if has_text_layer:
+        dpi = TEXT_LAYER_DPI
+    else:
+        # Scanned page: render close to the native resolution of the largest
+        # embedded image, since rendering above it only adds pixels to OCR.
+        native_dpi = 0
+        for info in page.get_image_info():
+            bbox_w = info['bbox'][2] - info['bbox'][0]
+            if bbox_w > 0:
+                native_dpi = max(native_dpi, info['width'] / (bbox_w / 72.0))
+        dpi = native_dpi or 200
+        if long_edge_pt <= SMALL_PAGE_MAX_EDGE_PT:
+            dpi = max(dpi, SMALL_PAGE_DPI)
+        dpi = min(max(dpi, SCAN_MIN_DPI), SCAN_MAX_DPI)
+
+    # Never exceed the pixel cap on the long edge
+    max_dpi_for_size = MAX_RENDER_EDGE_PX / (long_edge_pt / 72.0)
+    return int(min(dpi, max_dpi_for_size))
+
+def probe_text_layer(page):
+    """
+    Checks a page for an embedded text layer good enough to skip OCR.
+    Returns (text, is_usable).
+    """
+    text = page.get_text("text")
+    chars = [c for c in text if not c.isspace()]
+    if len(chars) < MIN_TEXT_LAYER_CHARS:
+        return text, False
+    alnum = sum(1 for c in chars if c.isalnum())
+    return text, (alnum / len(chars)) >= MIN_TEXT_LAYER_ALNUM_RATIO
+
+def render_page(doc, page_index, output_base):
     """
-    Converts a PDF file into individual image files (one per page).
-    Returns a list of file paths to the generated images.
+    Prepares a single page of an open PDF for processing.
+
+    Born-digital pages are copied out as a one-page PDF (text extraction, no
+    OCR); image-only pages are rasterized to PNG for Tesseract.
+    Returns the path of the written file.
     """
+    page = doc.load_page(page_index)
+
+    text, usable = probe_text_layer(page)
+    if usable:
+        output_path = output_base + '.pdf'
+        single = fitz.open()
+        single.insert_pdf(doc, from_page=page_index, to_page=page_index)
+        single.save(output_path)
+        single.close()
+        return output_path
+
+    # A thin or garbled text layer on a vector-only page still renders crisp at
+    # low DPI; anything carrying a scan is treated as a scan.
+    has_vector_text = bool(text.strip()) and not page.get_image_info()
+    dpi = choose_render_dpi(page, has_text_layer=has_vector_text)
+    zoom = dpi / 72.0
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    output_path = output_base + '.png'
+    pix.save(output_path)
+    return output_path
+
+def _init_render_worker():
+    global _worker_doc
+    _worker_doc = {'path': None, 'doc': None}
+
+def _render_task(args):
+    file_path, page_index, output_base = args
+    if _worker_doc['path'] != file_path:
+        if _worker_doc['doc'] is not None:
+            _worker_doc['doc'].close()
+        _worker_doc['doc'] = fitz.open(file_path)
+        _worker_doc['path'] = file_path
+    return render_page(_worker_doc['doc'], page_index, output_base)
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                        mp_context=multiprocessing.get_context(RENDER_START_METHOD),
+                                        initializer=_init_render_worker)
+    return _executor
+
+def get_page_count(file_path):
+    try:
+        with fitz.open(file_path) as doc:
+            return doc.page_count
+    except Exception as e:
+        logger.error("Error reading PDF %s: %s", file_path, e)
+        return 0
+
+def count_pages_by_queue(file_path):
+    """
+    Pages per processing queue, using the same text-layer probe as
+    render_page: usable text layers go to 'text', the rest to 'ocr'.
+    """
+    counts = {}
     try:
-        doc = fitz.open(file_path)
-        output_files = []
-        
-        base_name = os.path.splitext(os.path.basename(file_path))[0]
-        
-        for i in range(len(doc)):
-            page = doc.load_page(i)
-            # Zoom = 2.0 -> 144 DPI (approx) good for OCR
-            pix = page.get_pixmap(matrix=fitz.Matrix(2.0, 2.0))
-            
-            output_filename = f"{base_name}_page_{i+1}.png"
-            output_path = os.path.join(output_dir, output_filename)
-            
-            pix.save(output_path)
-            output_files.append(output_path)
-            
-        doc.close()
-        return output_files
-        
+        with fitz.open(file_path) as doc:
+            for page in doc:
+                _, usable = probe_text_layer(page)
+                queue_name = 'text' if usable else 'ocr'
+                counts[queue_name] = counts.get(queue_name, 0) + 1
     except Exception as e:
-        print(f"Error splitting PDF {file_path}: {e}")
-        return []
+        logger.error("Error reading PDF %s: %s", file_path, e)
+    return counts
+
+def iter_pdf_pages(file_path, output_dir):
+    """
+    Splits a PDF page by page and yields each page file as soon as it is
+    written, in page order, so callers can start OCR on page 1 while later
+    pages are still rendering. Pages with a usable text layer come out as
+    one-page PDFs, image-only pages as PNGs.
+
+    A page that fails to render raises, after the pages before it were
+    yielded, so the caller can handle the remainder.
+    """
+    page_count = get_page_count(file_path)
+    if not page_count:
+        return
+
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    tasks = [
+        (file_path, i, os.path.join(output_dir, f"{base_name}_page_{i+1}"))
+        for i in range(page_count)
+    ]
+
+    try:
+        if page_count < MIN_PARALLEL_PAGES or RENDER_WORKERS <= 1:
+            # Inline on the caller's thread, with a handle of its own
+            with fitz.open(file_path) as doc:
+                for _, page_index, output_base in tasks:
+                    yield render_page(doc, page_index, output_base)
+        else:
+            for output_path in _get_executor().map(_render_task, tasks):
+                yield output_path
+    except Exception as e:
+        logger.error("Error splitting PDF %s: %s", file_path, e)
+        raise
+
+def split_pdf(file_path, output_dir):
+    """
+    Converts a PDF file into individual page files (one per page): PNG images
+    for scanned pages, one-page PDFs for born-digital pages.
+    Returns a list of file paths to the generated files.
+    """
+    return list(iter_pdf_pages(file_path, output_dir))
 
 def detect_separators(file_path):
     """
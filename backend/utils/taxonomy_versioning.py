@@ -1,5 +1,5 @@
 import sqlite3
-from database.db import get_db_connection
+from database.db import get_db_connection, bump_taxonomy_version
 
 def update_taxonomy_item_versioned(item_id, new_value, new_status='Active'):
     """
@@ -42,10 +42,12 @@ def update_taxonomy_item_versioned(item_id, new_value, new_status='Active'):
         
         # Step 2: Insert new
         new_version = current_version + 1
+        keywords = old_item['keywords'] if 'keywords' in old_item.keys() else None
         cur.execute('''
-            INSERT INTO taxonomy (category, value, status, version_number, parent_version_id)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (category, new_value, new_status, new_version, item_id))
+            INSERT INTO taxonomy (category, value, status, version_number, parent_version_id, keywords)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (category, new_value, new_status, new_version, item_id, keywords))
+        bump_taxonomy_version(conn)
         
         conn.commit()
         return {"message": "Taxonomy updated with new version", "new_version": new_version}
@@ -0,0 +1,69 @@
+import os
+import hashlib
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+class HashingUploadFile:
+    """
+    Temp file for an incoming upload that updates a SHA-256 digest as bytes are
+    written. Werkzeug's multipart parser writes the request body into it chunk by
+    chunk, so hashing and spooling to disk happen in a single pass and memory use
+    is bounded by the parser's chunk size.
+
+    The temp file lives next to its final destination so commit() is a rename.
+    If the upload is rejected (duplicate, validation error, aborted request) the
+    temp file is removed when the request closes its files.
+    """
+
+    def __init__(self, folder):
+        os.makedirs(folder, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=folder, suffix='.part', delete=False)
+        self.path = self.file.name
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.committed = False
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+    def commit(self, dest_path):
+        """Moves the spooled upload to its final path."""
+        self.file.close()
+        os.replace(self.path, dest_path)
+        self.committed = True
+        self.path = dest_path
+        return dest_path
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+        if not self.committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        # read/seek/tell/flush etc. go straight to the temp file
+        return getattr(self.file, name)
+
+
+def spool_upload(file_storage, folder):
+    """
+    Returns the HashingUploadFile behind a werkzeug FileStorage. Uploads parsed
+    by IntakeRequest already have one; anything else is copied in chunks.
+    """
+    if isinstance(file_storage.stream, HashingUploadFile):
+        return file_storage.stream
+
+    spooled = HashingUploadFile(folder)
+    while True:
+        chunk = file_storage.stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        spooled.write(chunk)
+    spooled.flush()
+    return spooled
@@ -0,0 +1,143 @@
+import os
+import socket
+import threading
+from concurrent.futures import Future
+from database.db import (
+    enqueue_job, lease_job, heartbeat_job, complete_job_statement, fail_job, count_open_jobs,
+    release_db_connection
+)
+from database.write_batcher import get_write_batcher
+
+
+class WorkerPool:
+    """
+    Bounded pool of persistent worker threads for document processing.
+
+    Work is split into named queues backed by the `jobs` table. Each queue has
+    its own number of workers (the maximum number of jobs of that kind running
+    at once, e.g. concurrent Tesseract processes) and a capacity (the maximum
+    number of unfinished jobs). Callers reserve slots before creating work so
+that intake can back off instead of piling up.
+
+    Because jobs live in SQLite, several pools (the Flask app and any number of
+    scripts/ocr_worker.py processes) can consume the same queues, and pages
+    left behind by a crashed process are picked up again when their lease expires.
+    """
+
+    def __init__(self, handler, lease_seconds=60, poll_interval=2.0):
+        self.handler = handler
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.worker_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self.queues = {}
+        self.active = {}   # job_id -> worker_id, for heartbeats
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.started = False
+
+    def add_queue(self, name, workers, capacity):
+        self.queues[name] = {
+            'workers': max(1, int(workers)),
+            'capacity': max(1, int(capacity)),
+            'running': 0,
+            'reserved': 0   # slots promised to uploads, not yet enqueued
+        }
+
+    def reserve(self, name, count):
+        """
+        Claims `count` slots on a queue, counting unfinished jobs plus slots
+        other uploads reserved but have not submitted yet. Returns False if
+        they do not fit. An idle queue always admits the request, so a single
+        upload larger than the capacity is processed instead of being rejected
+        forever.
+        """
+        q = self.queues[name]
+        with self.lock:
+            pending = count_open_jobs(name) + q['reserved']
+            if pending and pending + count > q['capacity']:
+                return False
+            q['reserved'] += count
+            return True
+
+    def release(self, name, count):
+        """Gives back reserved slots that were not used for a submit."""
+        q = self.queues[name]
+        with self.lock:
+            q['reserved'] = max(0, q['reserved'] - count)
+
+    def submit(self, name, doc_id, filepath, reserved=True):
+        """Queues a job, on a previously reserved slot unless reserved=False."""
+        job_id = enqueue_job(name, doc_id, filepath)
+        if reserved:
+            # Once the job row exists it counts as an open job instead
+            self.release(name, 1)
+        self.wakeup.set()
+        return job_id
+
+    def start(self):
+        with self.lock:
+            if self.started:
+                return
+            self.started = True
+        for name, q in self.queues.items():
+            for i in range(q['workers']):
+                worker_id = f"{self.worker_prefix}-{name}-{i + 1}"
+                t = threading.Thread(target=self._worker_loop, args=(name, worker_id), name=worker_id)
+                t.daemon = True
+                t.start()
+        t = threading.Thread(target=self._heartbeat_loop, name=f"{self.worker_prefix}-heartbeat")
+        t.daemon = True
+        t.start()
+
+    def stats(self):
+        with self.lock:
+            return {
+                name: {
+                    'workers': q['workers'],
+                    'capacity': q['capacity'],
+                    'reserved': q['reserved'],
+                    'running': q['running']
+                }
+                for name, q in self.queues.items()
+            }
+
+    def _worker_loop(self, name, worker_id):
+        q = self.queues[name]
+        while True:
+            job = lease_job(name, worker_id, self.lease_seconds)
+            if not job:
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+                continue
+
+            with self.lock:
+                q['running'] += 1
+                self.active[job['id']] = worker_id
+            try:
+                result = self.handler(job['document_id'], job['payload'])
+                # Committed with (or right after) the page's own writes; if a
+                # handler returns the Future of those writes, their failure
+                # fails the job instead of marking it done
+                after = result if isinstance(result, Future) else None
+                get_write_batcher().submit([complete_job_statement(job['id'], worker_id)], after=after).result()
+            except Exception as e:
+                status = fail_job(job['id'], worker_id, e)
+                print(f"[WorkerPool] Job {job['id']} (doc {job['document_id']}) failed on attempt {job['attempts']}: {e} -> {status}")
+            finally:
+                # Workers keep their connection; only discard what the job left open
+                release_db_connection()
+                with self.lock:
+                    q['running'] -= 1
+                    self.active.pop(job['id'], None)
+
+    def _heartbeat_loop(self):
+        interval = max(1, self.lease_seconds // 3)
+        stop = threading.Event()
+        while not stop.wait(interval):
+            with self.lock:
+                active = list(self.active.items())
+            for job_id, worker_id in active:
+                try:
+                    heartbeat_job(job_id, worker_id, self.lease_seconds)
+                except Exception as e:
+                    print(f"[WorkerPool] Heartbeat failed for job {job_id}: {e}")
@@ -5,13 +5,19 @@ import DocumentViewer from './DocumentViewer';
 import FolderTree from './FolderTree';
 import { Search, FileText, Info, Star, Download, Filter, FolderTree as FolderIcon, Trash2 } from 'lucide-react';
 
+const PAGE_SIZE = 100;
+
 const Dashboard = ({ refreshTrigger, globalSearch, isAdmin, currentUser }) => {
     const [documents, setDocuments] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    // Query string of the first page; the cursor is only valid with it
+    const [pageQuery, setPageQuery] = useState('');
     const [searchTerm, setSearchTerm] = useState('');
     const [loading, setLoading] = useState(false);
     const [taxonomy, setTaxonomy] = useState([]);
 
     const [selectedDoc, setSelectedDoc] = useState(null);
+    const [docDetail, setDocDetail] = useState(null); // Full record (content, metadata) for selectedDoc
     const [docVersions, setDocVersions] = useState([]);
     const [auditLogs, setAuditLogs] = useState([]);
     const [activeModalTab, setActiveModalTab] = useState('metadata');
@@ -37,43 +43,56 @@ const Dashboard = ({ refreshTrigger, globalSearch, isAdmin, currentUser }) => {
         tags: ''
     });
 
-    const fetchDocuments = async (query = '') => {
-        setLoading(true);
-        try {
-            let url = 'http://127.0.0.1:5000/documents?';
-            const params = new URLSearchParams();
-            if (filters.category) params.append('category', filters.category);
-            if (filters.start_date) params.append('start_date', filters.start_date);
-            if (filters.end_date) params.append('end_date', filters.end_date);
-            if (filters.approval_status) params.append('approval_status', filters.approval_status);
-            if (filters.status) params.append('status', filters.status);
-            if (filters.subsidiary) params.append('subsidiary', filters.subsidiary);
-            if (filters.department) params.append('department', filters.department);
-            if (filters.function) params.append('function', filters.function);
-            if (filters.tags) params.append('tags', filters.tags);
-
-            // Permissions
-            params.append('is_admin', isAdmin ? 'true' : 'false');
-            params.append('is_admin', isAdmin ? 'true' : 'false');
-            params.append('user_id', currentUser?.id || 'Gokul_Admin');
-
-            // Only show published documents in the main library (unless specific filter overrides?)
-            // Actually, keep it consistent with existing logic
-            // Removed only_published constraint for visibility
-            // params.append('only_published', 'true');
-
-            if (selectedFolderId) params.append('container_id', selectedFolderId);
-
-            const searchQuery = query || globalSearch || searchTerm;
-            if (searchQuery) {
-                params.append('search', searchQuery);
-            }
+    const buildDocumentQuery = (query = '') => {
+        const params = new URLSearchParams();
+        if (filters.category) params.append('category', filters.category);
+        if (filters.start_date) params.append('start_date', filters.start_date);
+        if (filters.end_date) params.append('end_date', filters.end_date);
+        if (filters.approval_status) params.append('approval_status', filters.approval_status);
+        if (filters.status) params.append('status', filters.status);
+        if (filters.subsidiary) params.append('subsidiary', filters.subsidiary);
+        if (filters.department) params.append('department', filters.department);
+        if (filters.function) params.append('function', filters.function);
+        if (filters.tags) params.append('tags', filters.tags);
+
+        // Permissions
+        params.append('is_admin', isAdmin ? 'true' : 'false');
+        params.append('is_admin', isAdmin ? 'true' : 'false');
+        params.append('user_id', currentUser?.id || 'Gokul_Admin');
+
+        // Only show published documents in the main library (unless specific filter overrides?)
+        // Actually, keep it consistent with existing logic
+        // Removed only_published constraint for visibility
+        // params.append('only_published', 'true');
+
+        if (selectedFolderId) params.append('container_id', selectedFolderId);
+
+        const searchQuery = query || globalSearch || searchTerm;
+        if (searchQuery) {
+            params.append('search', searchQuery);
+        }
 
-            url += params.toString();
+        params.append('limit', PAGE_SIZE);
+        return params.toString();
+    };
 
-            const res = await fetch(url);
+    const fetchDocuments = async (query = '', cursor = null) => {
+        if (!cursor) setLoading(true);
+        try {
+            // Later pages repeat the query their cursor was issued for, even if
+            // the search box or filters were edited since
+            const pageParams = cursor ? pageQuery : buildDocumentQuery(query);
+            const cursorParam = cursor ? `&cursor=${encodeURIComponent(cursor)}` : '';
+            const res = await fetch(`http://127.0.0.1:5000/documents?${pageParams}${cursorParam}`);
+            if (!res.ok) {
+                console.error("Failed to fetch docs", await res.json().catch(() => null));
+                setNextCursor(null);
+                return;
+            }
             const data = await res.json();
-            setDocuments(data);
+            if (!cursor) setPageQuery(pageParams);
+            setNextCursor(res.headers.get('X-Next-Cursor'));
+            setDocuments(prev => cursor ? [...prev, ...data] : data);
         } catch (err) {
             console.error("Failed to fetch docs", err);
         } finally {
@@ -175,6 +194,7 @@ const Dashboard = ({ refreshTrigger, globalSearch, isAdmin, currentUser }) => {
             if (isActive) {
                 setDocVersions([]);
                 setAuditLogs([]);
+                setDocDetail(null);
                 setReclassifyCategory(selectedDoc.category);
                 setActiveModalTab('metadata');
                 setShowRejectInput(false);
@@ -182,9 +202,10 @@ const Dashboard = ({ refreshTrigger, globalSearch, isAdmin, currentUser }) => {
             }
 
             try {
-                const [verRes, auditRes] = await Promise.all([
+                const [verRes, auditRes, detailRes] = await Promise.all([
                     fetch(`http://127.0.0.1:5000/documents/${selectedDoc.id}/versions`),
-                    fetch(`http://127.0.0.1:5000/audit/document/${selectedDoc.id}`)
+                    fetch(`http://127.0.0.1:5000/audit/document/${selectedDoc.id}`),
+                    fetch(`http://127.0.0.1:5000/document/${selectedDoc.id}`)
                 ]);
 
                 if (!isActive) {
@@ -194,6 +215,7 @@ const Dashboard = ({ refreshTrigger, globalSearch, isAdmin, currentUser }) => {
 
                 const versions = await verRes.json();
                 const logs = await auditRes.json();
+                const detail = await detailRes.json();
 
                 if (isActive) {
                     // Double check ID match just in case
@@ -203,6 +225,7 @@ const Dashboard = ({ refreshTrigger, globalSearch, isAdmin, currentUser }) => {
                         console.log(`[Details] Received data for ID: ${selectedDoc.id}. Match found: True.`);
                         setDocVersions(versions);
                         setAuditLogs(logs);
+                        setDocDetail(detail);
                     }
                 }
             } catch (err) {
@@ -554,6 +577,11 @@ const Dashboard = ({ refreshTrigger, globalSearch, isAdmin, currentUser }) => {
                             )}
                         </tbody>
                     </table>
+                    {nextCursor && !loading && (
+                        <div style={{ textAlign: 'center', padding: '1rem' }}>
+                            <button className="btn btn-ghost" onClick={() => fetchDocuments('', nextCursor)}>Load more</button>
+                        </div>
+                    )}
                 </div>
             </div>
 
@@ -605,14 +633,14 @@ const Dashboard = ({ refreshTrigger, globalSearch, isAdmin, currentUser }) => {
                             <>
                                 <div style={{ marginBottom: '1.5rem', background: 'rgba(255,255,255,0.05)', padding: '1rem', borderRadius: '8px' }}>
                                     <h4 style={{ marginTop: 0, color: '#60a5fa' }}>Extracted Metadata</h4>
-                                    {selectedDoc.metadata ? (
+                                    {(docDetail || selectedDoc).metadata ? (
                                         <pre style={{ background: '#f8f8f8', padding: '1rem', borderRadius: '4px', overflow: 'auto', maxHeight: '300px' }}>
                                             {(() => {
                                                 try {
-                                                    const meta = typeof selectedDoc.metadata === 'string' ? JSON.parse(selectedDoc.metadata) : selectedDoc.metadata;
+                                                    const meta = typeof (docDetail || selectedDoc).metadata === 'string' ? JSON.parse((docDetail || selectedDoc).metadata) : (docDetail || selectedDoc).metadata;
                                                     return JSON.stringify(meta, null, 2);
                                                 } catch (e) {
-                                                    return selectedDoc.metadata || "{}";
+                                                    return (docDetail || selectedDoc).metadata || "{}";
                                                 }
                                             })()}
                                         </pre>
@@ -643,7 +671,7 @@ const Dashboard = ({ refreshTrigger, globalSearch, isAdmin, currentUser }) => {
                                 <div style={{ marginBottom: '1.5rem' }}>
                                     <h4 style={{ marginTop: 0 }}>OCR Content Snippet</h4>
                                     <div style={{ whiteSpace: 'pre-wrap', maxHeight: '150px', overflowY: 'auto', fontSize: '0.9rem', color: 'var(--text-muted)', border: '1px solid var(--glass-border)', padding: '0.5rem', borderRadius: '4px' }}>
-                                        {selectedDoc.content || 'No text content available.'}
+                                        {(docDetail || selectedDoc).content || 'No text content available.'}
                                     </div>
                                 </div>
 
@@ -18,14 +18,17 @@ const DocumentViewer = ({ doc: initialDoc, onClose, isAdmin, user_id }) => {
 
         const fetchData = async () => {
             try {
-                const [vRes, aRes] = await Promise.all([
+                const [vRes, aRes, dRes] = await Promise.all([
                     axios.get(`http://localhost:5000/documents/${currentDoc.id}/versions`),
-                    axios.get(`http://localhost:5000/audit/document/${currentDoc.id}`)
+                    axios.get(`http://localhost:5000/audit/document/${currentDoc.id}`),
+                    axios.get(`http://localhost:5000/document/${currentDoc.id}`)
                 ]);
 
                 if (isActive) {
                     setVersions(vRes.data);
                     setAuditLogs(aRes.data);
+                    // Listings only carry the summary columns; metadata comes from the full record
+                    setCurrentDoc(prev => ({ ...prev, ...dRes.data }));
                 }
             } catch (err) {
                 if (isActive) console.error("Failed to fetch document details", err);